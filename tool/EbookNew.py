@@ -5,7 +5,7 @@ from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QTreeWidgetItem, QMenu, QDialog, QLabel, QTextEdit,
                              QScrollArea, QColorDialog, QMessageBox, QSplitter, QFileDialog, QProgressBar, QInputDialog,
                              QStackedWidget, QFrame)
-from PyQt6.QtCore import Qt, QPoint, QTimer, QEvent, QRect
+from PyQt6.QtCore import Qt, QPoint, QTimer, QEvent, QRect, QRectF, QObject, pyqtSignal
 from PyQt6.QtGui import QPainter, QPen, QColor, QPixmap, QImage, QAction, QFont
 import fitz  # PyMuPDF
 import ebooklib
@@ -13,8 +13,574 @@ from ebooklib import epub
 import re
 from datetime import datetime
 import sqlite3
+import array
+import bisect
+import codecs
+import hashlib
+import heapq
+import html
+import itertools
+import mmap
+import multiprocessing
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
+PAGE_CACHE_MB = 256  # 已渲染页面缓存的内存预算
+PREFETCH_PAGES = 2  # 预渲染当前页前后各几页
+PREVIEW_ZOOM_RATIO = 0.35  # 清晰渲染完成前先用低分辨率快速预览
+ZOOM_SETTLE_MS = 150  # 连续缩放停下来多久后才开始清晰渲染
+RENDER_WORKERS = max(1, min(2, (os.cpu_count() or 1) - 1))  # 渲染进程数量
+TILE_SIZE = 512  # 分块渲染时每块的像素边长
+TILED_PAGE_PIXELS = 8 * 1024 * 1024  # 整页像素数超过该值时改为只渲染可见的分块
+EPUB_LAYOUT = (595, 842, 12)  # EPUB排版参数: 页宽, 页高(A4, 单位pt), 字号
+PAGE_TABLES = ['marks', 'labels', 'current_pages', 'notes']  # 按页码保存数据的表
+CONVERT_FORMATS = ['.mobi', '.azw', '.azw3']  # 需要用calibre转换为PDF的格式
+CONVERT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp_pdf')  # 转换结果缓存目录
+CONVERT_CACHE_MB = 1024  # 转换结果缓存的磁盘预算，超出时删除最久没用过的
+TXT_PAGE_LINES = 30  # TXT每页行数
+TXT_LINE_CHARS = 40  # TXT每行字数，超长的段落按这个字数折行分页
+TXT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'txt_index')  # TXT分页索引目录
+
+_worker_docs = OrderedDict()  # 渲染进程中已打开的文档
+
+
+def render_page_data(doc_path, page_id, zoom, tile=None, gray=False, layout=None):
+    """在渲染进程中执行：每个进程各自打开并保留文档，返回 (宽, 高, 行字节数, 像素数据, 是否灰度)
+
+    page_id为页码，可重排文档(EPUB)为 (章节, 章内页码)，只需要排版这一章；layout为可重排文档的排版参数；
+    tile为 (列, 行) 时只渲染页面上的这一块；gray时渲染为单通道灰度，内存只有彩色的三分之一
+    """
+    doc_key = (doc_path, layout)
+    doc = _worker_docs.get(doc_key)
+    if doc is None:
+        doc = fitz.open(doc_path)
+        if layout:
+            doc.layout(width=layout[0], height=layout[1], fontsize=layout[2])
+        _worker_docs[doc_key] = doc
+        if len(_worker_docs) > 2:
+            _worker_docs.popitem(last=False)[1].close()
+    else:
+        _worker_docs.move_to_end(doc_key)
+    page = doc[page_id]
+    colorspace = fitz.csGRAY if gray else fitz.csRGB
+    if tile is None:
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=colorspace, alpha=False)
+    else:
+        col, row = tile
+        step = TILE_SIZE / zoom
+        rect = page.rect
+        clip = fitz.Rect(rect.x0 + col * step, rect.y0 + row * step,
+                         rect.x0 + (col + 1) * step, rect.y0 + (row + 1) * step) & rect
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, colorspace=colorspace, alpha=False)
+    return pix.width, pix.height, pix.stride, pix.samples, gray
+
+
+class RenderedPage:
+    """渲染结果：QImage直接引用渲染进程传回的像素数据而不复制
+
+    像素数据和QImage保存在同一个对象里，保证图片存在期间数据一直有效；
+    QImage的副本不会持有数据，所以只传递这个对象，需要显示时再转为QPixmap
+    """
+    __slots__ = ('buffer', 'image')
+
+    def __init__(self, data):
+        width, height, stride, self.buffer, gray = data
+        image_format = QImage.Format.Format_Grayscale8 if gray else QImage.Format.Format_RGB888
+        self.image = QImage(self.buffer, width, height, stride, image_format)
+
+    def width(self):
+        return self.image.width()
+
+    def height(self):
+        return self.image.height()
+
+    def size_in_bytes(self):
+        return len(self.buffer)
+
+    def to_pixmap(self):
+        return QPixmap.fromImage(self.image)
+
+
+class PageCache:
+    """已渲染页面缓存：键为(书, 页码, 缩放, 分块, 是否灰度)，超出内存预算时淘汰最久未使用的"""
+
+    def __init__(self, budget_mb=PAGE_CACHE_MB):
+        self.budget = budget_mb * 1024 * 1024
+        self.entries = OrderedDict()
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(book, page, zoom, tile=None, gray=False):
+        return book, page, round(zoom, 3), tile, gray
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        page = self.entries.get(key)
+        if page is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return page
+
+    def put(self, key, page):
+        """page为RenderedPage"""
+        if key in self.entries:
+            self.used -= self.entries.pop(key).size_in_bytes()
+        self.entries[key] = page
+        self.used += page.size_in_bytes()
+        # 至少保留刚放入的页面
+        while self.used > self.budget and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.used -= old.size_in_bytes()
+
+    def discard_book(self, book):
+        """删除某本书的所有缓存页面"""
+        for key in [key for key in self.entries if key[0] == book]:
+            self.used -= self.entries.pop(key).size_in_bytes()
+
+    def clear(self):
+        self.entries.clear()
+        self.used = 0
+
+
+class RenderPool(QObject):
+    """页面渲染进程池：可见页面优先，其次是预渲染；PyMuPDF不支持多线程，所以在独立进程中渲染"""
+    page_ready = pyqtSignal(str, int, float, bool, object)  # 最后一个参数为RenderedPage
+    tile_ready = pyqtSignal(str, int, float, bool, int, int, object)
+    render_done = pyqtSignal(object, object)  # 内部使用：把进程池的回调转到界面线程
+
+    def __init__(self, workers=RENDER_WORKERS):
+        super().__init__()
+        self.workers = workers
+        self.executor = self.create_executor()
+        self.queue = []  # 等待渲染的请求: (优先级, 序号, 书, 文档路径, 页码, 缩放, 分块, 是否灰度, 排版参数, 章节位置)
+        self.counter = itertools.count()
+        self.running = {}  # 正在渲染: future -> 请求
+        self.retried = set()  # 渲染进程异常退出后已经重新排队过一次的缓存键
+        self.render_done.connect(self.on_render_done)
+
+    def create_executor(self):
+        executor = ProcessPoolExecutor(max_workers=self.workers,
+                                       mp_context=multiprocessing.get_context('spawn'))
+        # 提前启动渲染进程，避免打开第一页时等待进程启动
+        for _ in range(self.workers):
+            executor.submit(os.getpid)
+        return executor
+
+    @staticmethod
+    def item_key(item):
+        return PageCache.make_key(*item[2:3], *item[4:8])
+
+    def queued_keys(self):
+        return {self.item_key(item) for item in self.queue}
+
+    def request(self, book, doc_path, page_num, zoom, priority=0, tile=None, gray=False, layout=None, location=None):
+        """请求渲染页面或页面的一块，priority越小越先渲染，0为当前显示的页面
+
+        可重排文档需要传入排版参数layout和页面所在的章节位置location
+        """
+        key = PageCache.make_key(book, page_num, zoom, tile, gray)
+        if key in map(self.item_key, self.running.values()) or key in self.queued_keys():
+            return
+        heapq.heappush(self.queue, (priority, next(self.counter), book, doc_path, page_num, zoom, tile, gray,
+                                    layout, location))
+        self.dispatch()
+
+    def cancel_pending(self, tiles_only=False):
+        """取消还没开始渲染的请求，用户已经翻过去的页面不再渲染；tiles_only时只取消分块"""
+        if tiles_only:
+            self.queue = [item for item in self.queue if item[6] is None]
+            heapq.heapify(self.queue)
+        else:
+            self.queue.clear()
+
+    def dispatch(self):
+        while self.queue and len(self.running) < self.workers:
+            item = heapq.heappop(self.queue)
+            _, _, book, doc_path, page_num, zoom, tile, gray, layout, location = item
+            page_id = page_num if location is None else location
+            executor = self.executor
+            future = executor.submit(render_page_data, doc_path, page_id, zoom, tile, gray, layout)
+            self.running[future] = item
+            future.add_done_callback(lambda done, item=item, executor=executor:
+                                     self.render_done.emit(done, (executor, item)))
+
+    def requeue_running(self, items):
+        """进程池损坏时把正在渲染的请求放回队列；同一请求再次让进程退出时不再重试"""
+        for item in items:
+            key = self.item_key(item)
+            if key in self.retried:
+                print(f"渲染第 {item[4] + 1} 页时渲染进程再次异常退出，放弃渲染")
+                continue
+            self.retried.add(key)
+            heapq.heappush(self.queue, item)
+
+    def on_render_done(self, future, submitted):
+        self.running.pop(future, None)
+        executor, item = submitted
+        _, _, book, _, page_num, zoom, tile, gray, _, _ = item
+        try:
+            page = RenderedPage(future.result())
+            self.retried.discard(self.item_key(item))
+            if tile is None:
+                self.page_ready.emit(book, page_num, zoom, gray, page)
+            else:
+                self.tile_ready.emit(book, page_num, zoom, gray, tile[0], tile[1], page)
+        except BrokenProcessPool:
+            # 进程池损坏后其中所有的请求都会失败，只在第一次失败时重建，
+            # 正在渲染的请求(包括当前页和它的分块)放回队列，在新的进程池中重新渲染
+            if executor is self.executor:
+                print("渲染进程异常退出，重新启动")
+                self.requeue_running([item] + list(self.running.values()))
+                self.running.clear()
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = self.create_executor()
+        except Exception as e:
+            print(f"渲染第 {page_num + 1} 页时出错: {e}")
+        self.dispatch()
+
+    def shutdown(self):
+        self.queue.clear()
+        self.executor.shutdown(wait=True, cancel_futures=True)  # 只等待正在渲染的页面
+
+
+def file_digest(file_path):
+    """按文件内容计算哈希，同名的不同书籍和修改过的书籍得到不同的值"""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ConvertCache:
+    """电子书转换结果缓存：文件名为源文件内容的哈希，按最近使用时间(文件修改时间)淘汰"""
+
+    def __init__(self, cache_dir=CONVERT_CACHE_DIR, budget_mb=CONVERT_CACHE_MB):
+        self.cache_dir = cache_dir
+        self.budget = budget_mb * 1024 * 1024
+        self.digests = {}  # (路径, 大小, 修改时间) -> 内容哈希，避免重复读取整个文件
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def cached_digest(self, file_path):
+        """已经算过的内容哈希，文件改动过或没算过时返回None"""
+        stat = os.stat(file_path)
+        with self.lock:
+            return self.digests.get((file_path, stat.st_size, stat.st_mtime_ns))
+
+    def digest(self, file_path):
+        stat = os.stat(file_path)
+        key = (file_path, stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            if key in self.digests:
+                return self.digests[key]
+        value = file_digest(file_path)
+        with self.lock:
+            self.digests[key] = value
+        return value
+
+    def path_for(self, digest):
+        return os.path.join(self.cache_dir, digest + '.pdf')
+
+    def lookup(self, digest):
+        """返回已转换的PDF路径并标记为最近使用，没有时返回None"""
+        pdf_path = self.path_for(digest)
+        try:
+            os.utime(pdf_path)
+        except OSError:
+            return None
+        return pdf_path
+
+    def evict(self, keep=None):
+        """删除最久没用过的转换结果，直到总大小不超过预算"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.pdf') and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.budget:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as e:
+                print(f"删除转换缓存失败: {e}")
+
+
+class ConvertQueue(QObject):
+    """后台转换电子书：打开的书优先，其次是新导入书籍的预转换；calibre在独立进程中运行，不阻塞界面"""
+    converted = pyqtSignal(str, str)  # 源文件, 转换好的PDF
+    failed = pyqtSignal(str, str)  # 源文件, 错误信息
+    convert_done = pyqtSignal(object, str)  # 内部使用：把线程池的回调转到界面线程
+
+    def __init__(self, cache=None):
+        super().__init__()
+        self.cache = cache or ConvertCache()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.queue = []  # 等待转换: (优先级, 序号, 源文件)
+        self.counter = itertools.count()
+        self.running = None  # 正在转换的源文件
+        self.process = None  # 正在运行的ebook-convert进程
+        self.closed = False
+        self.tool_missing = False  # 没有安装calibre
+        self.convert_done.connect(self.on_convert_done)
+
+    def lookup(self, file_path):
+        """不读取文件，直接查找已转换的PDF"""
+        digest = self.cache.cached_digest(file_path)
+        return self.cache.lookup(digest) if digest else None
+
+    def request(self, file_path, priority=1):
+        """请求转换，priority为0表示用户正在等待打开这本书"""
+        if file_path == self.running or (self.tool_missing and priority > 0):
+            return
+        self.queue = [item for item in self.queue if item[2] != file_path]
+        heapq.heapify(self.queue)
+        heapq.heappush(self.queue, (priority, next(self.counter), file_path))
+        self.dispatch()
+
+    def dispatch(self):
+        if self.running is None and self.queue and not self.closed:
+            _, _, file_path = heapq.heappop(self.queue)
+            self.running = file_path
+            future = self.executor.submit(self.convert, file_path)
+            future.add_done_callback(lambda done, file_path=file_path: self.convert_done.emit(done, file_path))
+
+    def convert(self, file_path):
+        """在后台线程中执行：已经转换过同样内容的书时直接返回缓存"""
+        digest = self.cache.digest(file_path)
+        pdf_path = self.cache.lookup(digest)
+        if pdf_path:
+            return pdf_path
+
+        pdf_path = self.cache.path_for(digest)
+        temp_path = pdf_path[:-len('.pdf')] + '.part.pdf'  # 转换完成后再改名，中断时不会留下不完整的缓存
+        # 添加转换参数以优化输出质量
+        cmd = [
+            'ebook-convert',
+            file_path,
+            temp_path,
+            '--pdf-page-numbers',
+            '--paper-size', 'a4',
+            '--pdf-default-font-size', '12',
+            '--pdf-serif-family', 'Times New Roman',
+            '--pdf-sans-family', 'Arial',
+            '--pdf-mono-family', 'Courier New',
+            '--preserve-cover-aspect-ratio'
+        ]
+        self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        _, stderr = self.process.communicate()
+        if self.process.returncode != 0 or self.closed:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise Exception(f"转换失败: {stderr}")
+        os.replace(temp_path, pdf_path)
+        self.cache.evict(keep=pdf_path)
+        return pdf_path
+
+    def on_convert_done(self, future, file_path):
+        self.running = None
+        self.process = None
+        if not self.closed:
+            try:
+                self.converted.emit(file_path, future.result())
+            except FileNotFoundError as e:
+                if e.filename == 'ebook-convert':
+                    # 没有安装calibre时后面的书也无法转换
+                    self.tool_missing = True
+                    self.queue.clear()
+                self.failed.emit(file_path, str(e))
+            except Exception as e:
+                self.failed.emit(file_path, str(e))
+        self.dispatch()
+
+    def shutdown(self):
+        self.closed = True
+        self.queue.clear()
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class TxtDocument(QObject):
+    """TXT文档：内存映射文件，后台线程建立每页起始位置的索引，只解码正在显示的那一页
+
+    索引保存在TXT_INDEX_DIR中，文件没有改动时再次打开直接读取索引
+    """
+    index_progress = pyqtSignal()  # 索引有进展或已完成(在后台线程中发出)
+
+    def __init__(self, file_path):
+        super().__init__()
+        self.name = file_path
+        self.file = open(file_path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.size = size
+        self.encoding, start = self.detect_encoding()
+        # 换行符按编码的码元查找，UTF-16中汉字的某个字节也可能等于换行符
+        self.newline = '\n'.encode(self.encoding)
+        self.unit = len(self.newline)
+        self.page_offsets = array.array('Q', [start])  # 每页的起始字节位置
+        self.finished = False
+        self.closed = False
+        self.lock = threading.Lock()
+        self.index_path = self.index_file(file_path)
+        self.thread = None
+        if not self.load_index():
+            self.thread = threading.Thread(target=self.build_index, daemon=True)
+            self.thread.start()
+
+    def __len__(self):
+        """已经确定的页数，索引还没完成时最后一页的结尾未知，不计入"""
+        with self.lock:
+            return len(self.page_offsets) if self.finished else len(self.page_offsets) - 1
+
+    def __bool__(self):
+        return True
+
+    def detect_encoding(self):
+        """按文件开头判断编码，返回 (编码, 正文起始位置)：先看BOM，再看是否为没有BOM的UTF-16，
+        然后是UTF-8，都不是时按GB18030(兼容GBK和GB2312)读取"""
+        head = self.data[:64 * 1024]
+        for bom, encoding in [(codecs.BOM_UTF8, 'utf-8'), (codecs.BOM_UTF16_LE, 'utf-16-le'),
+                              (codecs.BOM_UTF16_BE, 'utf-16-be')]:
+            if head[:len(bom)] == bom:
+                return encoding, len(bom)
+
+        # 没有BOM的UTF-16：英文字符和换行的高位字节为0，0字节集中在奇数或偶数位置
+        sample = head[:4096]
+        even, odd = sample[0::2].count(0), sample[1::2].count(0)
+        if len(sample) >= 2 and max(even, odd) >= len(sample) // 8 and min(even, odd) * 4 <= max(even, odd):
+            encoding = 'utf-16-le' if odd > even else 'utf-16-be'
+            try:
+                codecs.getincrementaldecoder(encoding)().decode(sample[:len(sample) // 2 * 2], final=False)
+                return encoding, 0
+            except UnicodeDecodeError:
+                pass
+
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+            return 'utf-8', 0
+        except UnicodeDecodeError:
+            return 'gb18030', 0
+
+    def index_file(self, file_path):
+        """索引文件路径：文件、分页参数或识别出的编码不同时使用不同的索引"""
+        stat = os.stat(file_path)
+        key = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{TXT_PAGE_LINES}|{TXT_LINE_CHARS}" \
+              f"|{self.encoding}"
+        return os.path.join(TXT_INDEX_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.idx')
+
+    def load_index(self):
+        try:
+            offsets = array.array('Q')
+            with open(self.index_path, 'rb') as f:
+                offsets.frombytes(f.read())
+        except (OSError, ValueError):
+            return False
+        if not offsets:
+            return False
+        self.page_offsets = offsets
+        self.finished = True
+        return True
+
+    def save_index(self):
+        try:
+            os.makedirs(TXT_INDEX_DIR, exist_ok=True)
+            temp_path = self.index_path + '.part'
+            with open(temp_path, 'wb') as f:
+                self.page_offsets.tofile(f)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            print(f"保存TXT分页索引失败: {e}")
+
+    def line_end(self, pos):
+        """从pos(字符边界)开始的这一行的结尾位置(包含换行符)"""
+        end = self.data.find(self.newline, pos)
+        while end >= 0 and (end - pos) % self.unit:
+            end = self.data.find(self.newline, end + 1)  # 跨越两个码元的字节不是换行符
+        return self.size if end < 0 else end + self.unit
+
+    def char_boundary(self, start, offset):
+        """把offset调整到字符边界：从行首start解码到offset，去掉末尾不完整字符的字节"""
+        decoder = codecs.getincrementaldecoder(self.encoding)('replace')
+        decoder.decode(self.data[start:offset])
+        return offset - len(decoder.getstate()[0])
+
+    def build_index(self):
+        """在后台线程中执行：逐行统计折行后的行数，每满TXT_PAGE_LINES行记录一个分页位置"""
+        data, size, encoding = self.data, self.size, self.encoding
+        pos = self.page_offsets[0]
+        rows = 0  # 当前页已有的行数
+        pending = []  # 还没加入索引的分页位置，成批加入以减少加锁
+        while pos < size and not self.closed:
+            end = self.line_end(pos)
+            text = None
+            if end - pos <= TXT_LINE_CHARS:
+                line_rows = 1  # 字数不会超过字节数，短行不需要解码
+            else:
+                text = data[pos:end].decode(encoding, 'replace')
+                line_rows = max(1, -(-len(text.rstrip('\r\n')) // TXT_LINE_CHARS))
+            chars = 0
+            while rows + line_rows > TXT_PAGE_LINES:
+                # 段落跨页，在页末那一行的结尾处分页
+                fit = TXT_PAGE_LINES - rows
+                chars += fit * TXT_LINE_CHARS
+                # 含无法解码的字节时重新编码的长度不准，分页位置要落在字符边界上
+                pending.append(self.char_boundary(pos, min(end, pos + len(text[:chars].encode(encoding, 'replace')))))
+                line_rows -= fit
+                rows = 0
+            rows += line_rows
+            if rows == TXT_PAGE_LINES and end < size:
+                pending.append(end)
+                rows = 0
+            pos = end
+            if len(pending) >= 256:
+                self.add_pages(pending)
+                pending = []
+        self.add_pages(pending, finished=not self.closed)
+        if self.finished:
+            self.save_index()
+
+    def add_pages(self, offsets, finished=False):
+        with self.lock:
+            self.page_offsets.extend(offsets)
+            self.finished = finished
+        self.index_progress.emit()
+
+    def is_indexed(self, page_num):
+        """这一页的索引是否已经建立，不等待后台线程"""
+        return 0 <= page_num < len(self)
+
+    def page_text(self, page_num):
+        """只解码这一页的内容"""
+        with self.lock:
+            start = self.page_offsets[page_num]
+            end = self.page_offsets[page_num + 1] if page_num + 1 < len(self.page_offsets) else self.size
+        return self.data[start:end].decode(self.encoding, 'replace')
+
+    def close(self):
+        self.closed = True
+        if self.thread is not None:
+            self.thread.join()
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
 
 class MarkableLabel(QLabel):
     """可以手写标记的标签"""
@@ -55,6 +621,11 @@ class MarkableLabel(QLabel):
         self.marks_history = []  # 标记历史
         self.labels_history = []  # 标签历史
 
+        # 分块显示大页面
+        self.tile_size = 0  # 为0时按普通图片显示
+        self.tiles = {}  # (列, 行) -> RenderedPage
+        self.tile_backdrop = None  # 分块还没渲染好时拉伸显示的低分辨率页面(RenderedPage)
+
     def mousePressEvent(self, event):
         """处理鼠标按下事件"""
         main_window = self.get_main_window()
@@ -176,6 +747,19 @@ class MarkableLabel(QLabel):
         super().paintEvent(event)
         painter = QPainter(self)
 
+        # 分块显示的页面
+        if self.tile_size:
+            if self.tile_backdrop is not None:
+                # 只拉伸需要重绘的区域
+                target = QRectF(event.rect())
+                scale_x = self.tile_backdrop.width() / max(1, self.minimumWidth())
+                scale_y = self.tile_backdrop.height() / max(1, self.minimumHeight())
+                source = QRectF(target.x() * scale_x, target.y() * scale_y,
+                                target.width() * scale_x, target.height() * scale_y)
+                painter.drawImage(target, self.tile_backdrop.image, source)
+            for (col, row), tile in self.tiles.items():
+                painter.drawImage(col * self.tile_size, row * self.tile_size, tile.image)
+
         # 绘制标记
         for mark in self.marks:
             pen = QPen(mark['color'], mark['width'])
@@ -231,6 +815,23 @@ class MarkableLabel(QLabel):
                     painter.drawText(label['pos'].x(), y, line)
                     y += fm.height()  # 移动到下一行
 
+    def set_tiled_page(self, width, height, backdrop=None):
+        """改为分块显示，页面大小为width x height"""
+        self.setPixmap(QPixmap())
+        self.tile_size = TILE_SIZE
+        self.tiles = {}
+        self.tile_backdrop = backdrop
+        self.setMinimumSize(width, height)
+        self.update()
+
+    def clear_tiles(self):
+        """退出分块显示"""
+        if self.tile_size:
+            self.tile_size = 0
+            self.tiles = {}
+            self.tile_backdrop = None
+            self.setMinimumSize(0, 0)
+
     def clear_marks(self):
         """清除所有标记"""
         self.marks = []
@@ -351,6 +952,28 @@ class EbookManager(QMainWindow):
         self.zoom_factor = 1.0  # 缩放因子
         self.min_zoom = 0.1  # 最小缩放
         self.max_zoom = 5.0  # 最大缩放
+        self.page_cache = PageCache()  # 已渲染页面缓存
+        self.render_pool = RenderPool()  # 后台渲染进程
+        self.render_pool.page_ready.connect(self.on_page_rendered)
+        self.page_source = None  # 当前显示的页面对应的渲染结果: (书, 页码, 缩放, RenderedPage)
+        self.render_pool.tile_ready.connect(self.on_tile_rendered)
+        self.visible_tiles = set()  # 分块显示时视野内(含边缘)的分块
+        self.gray_books = set()  # 按灰度渲染的书籍
+
+        # 可重排文档(EPUB)按章节逐步分页
+        self.doc_layout = None  # 可重排文档的排版参数，PDF为None
+        self.chapter_pages = []  # 已分页章节的页数
+        self.chapter_starts = []  # 已分页章节第一页的页码
+        self.pagination_timer = QTimer()
+        self.pagination_timer.setSingleShot(True)
+        self.pagination_timer.timeout.connect(self.paginate_in_background)
+        self.waiting_txt_page = False  # TXT当前页的索引还没建立，显示的是提示
+        self.convert_queue = ConvertQueue()  # 后台转换MOBI/AZW
+        self.convert_queue.converted.connect(self.on_book_converted)
+        self.convert_queue.failed.connect(self.on_convert_failed)
+        self.zoom_timer = QTimer()  # 合并连续的缩放操作
+        self.zoom_timer.setSingleShot(True)
+        self.zoom_timer.timeout.connect(self.show_current_page)
         self.booklist_visible = True  # 书籍列表示态
         self.init_ui()
         self.init_database()
@@ -368,6 +991,7 @@ class EbookManager(QMainWindow):
         self.marking_enabled = False  # 标记状态
         self.zoom_states = {}  # 存储书的缩放状态
         self.load_zoom_states()  # 加载缩放状态
+        self.load_gray_books()
 
         # 启动初始检测（延迟1秒执行，让界面先加载完成）
         self.init_check_timer.start(1000)
@@ -536,6 +1160,9 @@ class EbookManager(QMainWindow):
         self.zoom_label.setFixedWidth(50)
         self.zoom_in_btn = QPushButton('放大')
         self.zoom_out_btn = QPushButton('缩小')
+        self.gray_btn = QPushButton('灰度')
+        self.gray_btn.setCheckable(True)
+        self.gray_btn.setToolTip('按灰度渲染当前书籍，适合纯文字书籍，占用内存更少')
 
         # 标记按钮
         self.add_note_btn = QPushButton('添加笔记')
@@ -556,6 +1183,7 @@ class EbookManager(QMainWindow):
         self.goto_btn.clicked.connect(self.goto_page)
         self.zoom_in_btn.clicked.connect(self.zoom_in)
         self.zoom_out_btn.clicked.connect(self.zoom_out)
+        self.gray_btn.clicked.connect(self.toggle_gray_mode)
         self.add_note_btn.clicked.connect(self.add_note)
         self.color_btn.clicked.connect(self.choose_color)
         self.undo_marks_btn.clicked.connect(self.undo_mark)
@@ -580,7 +1208,8 @@ class EbookManager(QMainWindow):
             self.goto_btn,
             self.zoom_out_btn,
             self.zoom_label,
-            self.zoom_in_btn
+            self.zoom_in_btn,
+            self.gray_btn
         ]
 
         # 添加���航按钮
@@ -639,6 +1268,12 @@ class EbookManager(QMainWindow):
         scroll_area.setWidget(self.content_display)
         scroll_area.setWidgetResizable(True)
         center_layout.addWidget(scroll_area)
+        self.scroll_area = scroll_area
+
+        # 分块显示时，滚动或窗口大小变化后加载新进入视野的分块
+        for scroll_bar in (scroll_area.horizontalScrollBar(), scroll_area.verticalScrollBar()):
+            scroll_bar.valueChanged.connect(self.update_tiles)
+            scroll_bar.rangeChanged.connect(self.update_tiles)
 
         # 右侧标签列表面板
         self.right_panel = QWidget()
@@ -814,6 +1449,25 @@ class EbookManager(QMainWindow):
                 )
             ''')
 
+            # 创建灰度渲染书籍表
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS gray_books (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    book_id INTEGER UNIQUE,
+                    FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
+                )
+            ''')
+
+            # 创建书籍排版参数表：记录可重排书籍的页码是按哪种排版计算的
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS book_layouts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    book_id INTEGER UNIQUE,
+                    layout TEXT,
+                    FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
+                )
+            ''')
+
             # 启用外键约束
             self.cursor.execute('PRAGMA foreign_keys = ON')
 
@@ -1024,6 +1678,118 @@ class EbookManager(QMainWindow):
         except Exception as e:
             print(f"保存放状态失败: {e}")
 
+    def check_book_layout(self, file_path, layout):
+        """可重排书籍的页码取决于排版参数，排版参数改变时处理按页保存的数据：
+        知道原来的排版时按章节内的位置换算到新页码；没有记录排版(以前按calibre转换的PDF阅读)时无法换算，
+        询问后把旧数据备份到*_legacy表再清除，笔记保留内容但页码改为第一页"""
+        if file_path not in self.books:
+            return
+        try:
+            book_id = self.books[file_path]['id']
+            layout_text = ','.join(str(value) for value in layout)
+            self.cursor.execute('SELECT layout FROM book_layouts WHERE book_id = ?', (book_id,))
+            row = self.cursor.fetchone()
+            if row and row[0] == layout_text:
+                return
+
+            pages = self.saved_pages(book_id)
+            if pages and row:
+                old_layout = tuple(float(value) for value in row[0].split(','))
+                moved = self.move_saved_pages(book_id, self.relayout_pages(file_path, old_layout, layout, pages))
+                if moved:
+                    self.statusBar().showMessage("排版已改变，标记、标签、笔记和阅读进度已换算到新的页码", 5000)
+            elif pages:
+                reply = QMessageBox.question(
+                    self, '排版已改变',
+                    f"《{self.books[file_path]['title']}》以前按转换后的PDF分页，保存的页码与现在的排版对应不上。\n"
+                    "是否清除该书的标记、标签和阅读进度，并把笔记移到第一页？\n旧数据会备份在数据库中。",
+                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+                if reply == QMessageBox.StandardButton.Yes:
+                    self.backup_saved_pages(book_id)
+                    self.statusBar().showMessage("已清除按旧页码保存的标记、标签和阅读进度，旧数据已备份", 5000)
+
+            self.cursor.execute('INSERT OR REPLACE INTO book_layouts (book_id, layout) VALUES (?, ?)',
+                                (book_id, layout_text))
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            print(f"检查排版参数失败: {e}")
+
+    def saved_pages(self, book_id):
+        """该书按页保存的数据用到的所有页码"""
+        self.cursor.execute(' UNION '.join(f'SELECT page FROM {table} WHERE book_id = ?' for table in PAGE_TABLES),
+                            (book_id,) * len(PAGE_TABLES))
+        return {row[0] for row in self.cursor.fetchall() if row[0] is not None}
+
+    @staticmethod
+    def relayout_pages(file_path, old_layout, new_layout, pages):
+        """按旧排版找到每页在章节中的位置，换成新排版后的页码，返回 {旧页码: 新页码}"""
+        doc = fitz.open(file_path)
+        try:
+            doc.layout(width=old_layout[0], height=old_layout[1], fontsize=old_layout[2])
+            bookmarks = {}
+            chapter, start = 0, 0
+            for page in sorted(pages):
+                while chapter < doc.chapter_count and page >= start + doc.chapter_page_count(chapter):
+                    start += doc.chapter_page_count(chapter)
+                    chapter += 1
+                if chapter >= doc.chapter_count:
+                    break  # 超出旧排版的总页数，保持原样
+                bookmarks[page] = doc.make_bookmark((chapter, page - start))
+
+            doc.layout(width=new_layout[0], height=new_layout[1], fontsize=new_layout[2])
+            locations = {page: doc.find_bookmark(bookmark) for page, bookmark in bookmarks.items()}
+            starts = [0]
+            for chapter in range(max((location[0] for location in locations.values()), default=0)):
+                starts.append(starts[-1] + doc.chapter_page_count(chapter))
+            return {page: starts[chapter] + number for page, (chapter, number) in locations.items()}
+        finally:
+            doc.close()
+
+    def move_saved_pages(self, book_id, mapping):
+        """按 {旧页码: 新页码} 修改该书按页保存的数据，返回修改的记录数"""
+        moved = 0
+        for table in PAGE_TABLES:
+            self.cursor.execute(f'SELECT id, page FROM {table} WHERE book_id = ?', (book_id,))
+            updates = [(mapping[page], id_) for id_, page in self.cursor.fetchall()
+                       if page in mapping and mapping[page] != page]
+            self.cursor.executemany(f'UPDATE {table} SET page = ? WHERE id = ?', updates)
+            moved += len(updates)
+        return moved
+
+    def backup_saved_pages(self, book_id):
+        """把该书按页保存的数据复制到*_legacy表，然后清除标记、标签和阅读进度，笔记页码改为第一页"""
+        for table in PAGE_TABLES:
+            self.cursor.execute(f'CREATE TABLE IF NOT EXISTS {table}_legacy AS SELECT * FROM {table} WHERE 0')
+            self.cursor.execute(f'INSERT INTO {table}_legacy SELECT * FROM {table} WHERE book_id = ?', (book_id,))
+        for table in ['marks', 'labels', 'current_pages']:
+            self.cursor.execute(f'DELETE FROM {table} WHERE book_id = ?', (book_id,))
+        self.cursor.execute('UPDATE notes SET page = 0 WHERE book_id = ?', (book_id,))
+
+    def load_gray_books(self):
+        """从数据库加载按灰度渲染的书籍"""
+        try:
+            self.cursor.execute('''
+                SELECT b.path
+                FROM gray_books g
+                JOIN books b ON g.book_id = b.id
+            ''')
+            self.gray_books = {row[0] for row in self.cursor.fetchall()}
+        except Exception as e:
+            print(f"加载灰度设置失败: {e}")
+
+    def save_gray_books(self):
+        """保存按灰度渲染的书籍到数据库"""
+        try:
+            self.cursor.execute('DELETE FROM gray_books')
+            for book_path in self.gray_books:
+                if book_path in self.books:
+                    self.cursor.execute('INSERT INTO gray_books (book_id) VALUES (?)',
+                                        (self.books[book_path]['id'],))
+            self.conn.commit()
+        except Exception as e:
+            print(f"保存灰度设置失败: {e}")
+
     def closeEvent(self, event):
         """程序关闭时的处理"""
         try:
@@ -1055,7 +1821,12 @@ class EbookManager(QMainWindow):
             self.save_library()
             self.save_notes()
             self.save_zoom_states()
+            self.save_gray_books()
             self.save_labels()  # 保存标签
+            self.render_pool.shutdown()
+            self.convert_queue.shutdown()
+            if isinstance(self.current_doc, TxtDocument):
+                self.current_doc.close()
 
             # 关闭数据库连接
             self.conn.close()
@@ -1092,8 +1863,12 @@ class EbookManager(QMainWindow):
         try:
             book_info = self.get_book_info(file_path)
             if book_info:
+                is_new = file_path not in self.books
                 self.books[file_path] = book_info
                 self.save_library()
+                # 新导入的MOBI/AZW在后台提前转换，打开时不用等待
+                if is_new and os.path.splitext(file_path)[1].lower() in CONVERT_FORMATS:
+                    self.convert_queue.request(file_path)
         except Exception as e:
             QMessageBox.warning(self, '错误', f'添加书失败: {str(e)}')
 
@@ -1172,10 +1947,15 @@ class EbookManager(QMainWindow):
             self.current_book_path = file_path
             self.zoom_factor = self.zoom_states.get(file_path, 1.0)
             self.update_zoom_label()
+            self.gray_btn.setChecked(file_path in self.gray_books)
 
             # 清除当前显示的标记
             self.content_display.marks = []
 
+            # EPUB的页码随排版参数变化，先把按页保存的数据对应到当前排版
+            if os.path.splitext(file_path)[1].lower() == '.epub':
+                self.check_book_layout(file_path, EPUB_LAYOUT)
+
             # 加载标记数据
             self.load_marks()
 
@@ -1192,14 +1972,23 @@ class EbookManager(QMainWindow):
                     self.save_current_page()
                 self.show_current_page()
             elif ext in ['.epub', '.mobi', '.azw', '.azw3']:
-                self.convert_and_open_ebook(file_path)
+                if ext == '.epub':
+                    self.open_epub(file_path)
+                else:
+                    self.convert_and_open_ebook(file_path)
+                # 加载上次阅读的页码，还在转换时等转换完成后在on_book_converted中加载
+                if self.current_doc is not None:
+                    if not self.load_current_page():  # 如果没有保存的页码，设为第一页
+                        self.current_page = 0
+                        self.save_current_page()
+                    self.show_current_page()
+            elif ext == '.txt':
+                self.open_txt(file_path)
                 # 加载上次阅读的页码
                 if not self.load_current_page():  # 如果没有保存的页码，设为第一页
                     self.current_page = 0
                     self.save_current_page()
                 self.show_current_page()
-            elif ext == '.txt':
-                self.open_txt(file_path)
 
             # 更新窗口标题
             if file_path in self.books:
@@ -1223,51 +2012,81 @@ class EbookManager(QMainWindow):
     def open_pdf(self, file_path):
         """打开PDF文件"""
         try:
-            self.current_doc = fitz.open(file_path)
+            self.set_document(fitz.open(file_path))
             # 不在这里设置 current_page = 0，让 load_current_page 来设置页码
             self.show_current_page()
         except Exception as e:
             QMessageBox.warning(self, '错误', f'打开PDF失败: {str(e)}')
 
+    def set_document(self, doc, layout=None):
+        """切换当前文档；可重排文档先排版，然后在后台逐章分页"""
+        self.pagination_timer.stop()
+        if isinstance(self.current_doc, TxtDocument):
+            self.current_doc.close()
+        self.current_doc = doc
+        self.doc_layout = layout
+        self.chapter_pages = []
+        self.chapter_starts = []
+        if layout:
+            doc.layout(width=layout[0], height=layout[1], fontsize=layout[2])
+            self.pagination_timer.start(0)
+
+    def page_count(self):
+        """已知的总页数，EPUB还在分页时为已分页章节的页数"""
+        if self.doc_layout is None:
+            return len(self.current_doc)
+        return self.chapter_starts[-1] + self.chapter_pages[-1] if self.chapter_pages else 0
+
+    def pagination_done(self):
+        if isinstance(self.current_doc, TxtDocument):
+            return self.current_doc.finished
+        return self.doc_layout is None or len(self.chapter_pages) >= self.current_doc.chapter_count
+
+    def paginate_chapter(self):
+        """给下一章分页，没有剩余章节时返回False"""
+        if self.pagination_done():
+            return False
+        start = self.page_count()
+        self.chapter_pages.append(self.current_doc.chapter_page_count(len(self.chapter_pages)))
+        self.chapter_starts.append(start)
+        return True
+
+    def paginate_in_background(self):
+        """每次只给一章分页，分页期间界面保持响应"""
+        if isinstance(self.current_doc, fitz.Document) and self.paginate_chapter():
+            self.update_page_label()
+            self.pagination_timer.start(0)
+
+    def has_page(self, page_num):
+        """页码是否存在，EPUB的这一页还没分页时立即给后面的章节分页；
+        TXT不等待后台索引，还在建立索引时认为页码可能存在，由show_current_page等索引到达后再显示"""
+        if isinstance(self.current_doc, TxtDocument):
+            return page_num >= 0 and (self.current_doc.is_indexed(page_num) or not self.current_doc.finished)
+        while page_num >= self.page_count() and self.paginate_chapter():
+            pass
+        return 0 <= page_num < self.page_count()
+
+    def page_location(self, page_num):
+        """可重排文档中页码对应的 (章节, 章内页码)，PDF返回None"""
+        if self.doc_layout is None:
+            return None
+        chapter = bisect.bisect_right(self.chapter_starts, page_num) - 1
+        return chapter, page_num - self.chapter_starts[chapter]
+
+    def update_page_label(self):
+        """更新页码显示，EPUB和TXT还没分页完时总页数后面加“+”"""
+        if isinstance(self.current_doc, (fitz.Document, TxtDocument)):
+            suffix = '' if self.pagination_done() else '+'
+            self.current_page_label.setText(f"{self.current_page + 1}/{self.page_count()}{suffix}")
+
     def open_epub(self, file_path):
-        """打开EPUB文件"""
+        """用PyMuPDF直接排版打开EPUB，不再转换为PDF；章节在需要时才分页"""
         try:
-            # 显示加载提示
-            self.statusBar().showMessage("正在转电子书格式...", 2000)
-            QApplication.processEvents()
-
-            # 创建时PDF文件路径
-            temp_dir = os.path.join(os.path.dirname(__file__), 'temp_pdf')
-            os.makedirs(temp_dir, exist_ok=True)
-            pdf_path = os.path.join(temp_dir, os.path.basename(file_path) + '.pdf')
-
-            # 如果已经有换好的PDF，直接打开
-            if os.path.exists(pdf_path):
-                self.current_doc = fitz.open(pdf_path)
-                self.current_page = 0
-                self.show_current_page()
-                return
-
-            # 使用 calibre 的命令行工具转换
-            try:
-                import subprocess
-                result = subprocess.run(['ebook-convert', file_path, pdf_path],
-                                        capture_output=True, text=True)
-                if result.returncode == 0:
-                    self.current_doc = fitz.open(pdf_path)
-                    self.current_page = 0
-                    self.show_current_page()
-                else:
-                    raise Exception(f"转换失败: {result.stderr}")
-            except FileNotFoundError:
-                QMessageBox.warning(self, '错误',
-                                    'ebook-convert 工具未找到。请安装 Calibre 软件。\n'
-                                    '下载地址: https://calibre-ebook.com/download')
-                return
-
+            self.set_document(fitz.open(file_path), EPUB_LAYOUT)
+            self.show_current_page()
         except Exception as e:
             QMessageBox.warning(self, '错误', f'打开EPUB失败: {str(e)}')
-            print(f"打开EPUB细错误: {e}")
+            print(f"打开EPUB详细错误: {e}")
 
     def load_epub_pages(self, start_page, count):
         """加载指定范围的页面"""
@@ -1308,66 +2127,19 @@ class EbookManager(QMainWindow):
             print(f"检查预加载时出错: {e}")
 
     def open_txt(self, file_path):
-        """打开TXT文件"""
+        """打开TXT文件：不读入整个文件，只显示当前页，分页索引在后台建立"""
         try:
-            # 清理之前的文档状态
-            self.current_doc = None
+            txt_doc = TxtDocument(file_path)
+            txt_doc.index_progress.connect(self.on_txt_indexed)
+            self.set_document(txt_doc)
             self.current_page = 0
 
-            # 尝试不同的编��方式打开文件
-            encodings = ['utf-8', 'gbk', 'gb2312', 'ansi']
-            content = None
-
-            for encoding in encodings:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        content = f.read()
-                    break  # 如果成功读取，跳出循环
-                except UnicodeDecodeError:
-                    continue
-
-            if content is None:
-                raise Exception("无法识别文件编码")
-
             # 清除之前的图片显示
-            self.content_display.clear()
+            self.content_display.clear_tiles()
             self.content_display.setPixmap(QPixmap())  # 清除之前的图片
-
-            # 设���基样式，添���动态换行和宽度限制
-            styled_content = f"""
-                <html>
-                <head>
-                    <style>
-                        body {{
-                            font-family: Arial, sans-serif;
-                            font-size: 20px;
-                            line-height: 1.6;
-                            margin: 20px;
-                            background-color: white;
-                            white-space: pre-wrap;
-                            word-wrap: break-word;
-                            max-width: 95%;
-                        }}
-                        p {{
-                            margin: 0;
-                            text-align: justify;
-                        }}
-                    </style>
-                </head>
-                <body>
-                    <p>{content}</p>
-                </body>
-                </html>
-            """
-
-            # 设置为富文本格式显示
             self.content_display.setTextFormat(Qt.TextFormat.RichText)
-            self.content_display.setText(styled_content)
             self.content_display.setWordWrap(True)  # 启用自动换行
 
-            # 更新页码显示（txt文件只有一页）
-            self.current_page_label.setText("1/1")
-
             print(f"成功打开TXT文件: {file_path}")
 
         except Exception as e:
@@ -1375,23 +2147,94 @@ class EbookManager(QMainWindow):
             QMessageBox.warning(self, '误', error_msg)
             print(error_msg)
 
+    def on_txt_indexed(self):
+        """TXT索引有进展：更新总页数，等待中的页面索引到达后立即显示"""
+        self.update_page_label()
+        txt_doc = self.current_doc
+        if not (self.waiting_txt_page and isinstance(txt_doc, TxtDocument)):
+            return
+        if txt_doc.is_indexed(self.current_page):
+            self.show_current_page()
+        elif txt_doc.finished:
+            # 要跳转的页超出了实际页数，停在最后一页
+            self.current_page = len(txt_doc) - 1
+            self.save_current_page()
+            self.show_current_page()
+
+    def show_txt_page(self):
+        """显示TXT的当前页，只排版这一页的文字"""
+        # 设���基样式，添���动态换行和宽度限制
+        styled_content = f"""
+            <html>
+            <head>
+                <style>
+                    body {{
+                        font-family: Arial, sans-serif;
+                        font-size: {round(20 * self.zoom_factor)}px;
+                        line-height: 1.6;
+                        margin: 20px;
+                        background-color: white;
+                        white-space: pre-wrap;
+                        word-wrap: break-word;
+                        max-width: 95%;
+                    }}
+                    p {{
+                        margin: 0;
+                        text-align: justify;
+                    }}
+                </style>
+            </head>
+            <body>
+                <p>{html.escape(self.current_doc.page_text(self.current_page))}</p>
+            </body>
+            </html>
+        """
+        self.content_display.setText(styled_content)
+
     def show_current_page(self):
         """显示当前页面"""
         try:
             if isinstance(self.current_doc, fitz.Document):  # PDF
-                if 0 <= self.current_page < len(self.current_doc):
+                if self.has_page(self.current_page):
                     # 更新页码显示
-                    self.current_page_label.setText(f"{self.current_page + 1}/{len(self.current_doc)}")
+                    self.update_page_label()
+
+                    # 优先使用已渲染的页面，没有时交给后台渲染，渲染完成后在on_page_rendered中显示
+                    self.render_pool.cancel_pending()
+                    rendered = self.page_cache.get(self.render_key(self.current_page, self.zoom_factor))
+                    if self.use_tiles():
+                        # 页面太大，只渲染视野内的分块，也不预渲染前后页
+                        self.show_tiled_page()
+                    elif rendered is not None:
+                        self.set_page_pixmap(rendered, self.zoom_factor)
+                    else:
+                        # 先拉伸已有的渲染结果占位，再快速渲染低分辨率预览，最后是清晰页面
+                        self.show_placeholder()
+                        preview_zoom = self.zoom_factor * PREVIEW_ZOOM_RATIO
+                        if not self.has_page_source() or self.page_source[2] < preview_zoom:
+                            self.request_render(self.current_page, preview_zoom, priority=0)
+                        self.request_render(self.current_page, self.zoom_factor, priority=0)
+                        self.statusBar().showMessage(f"正在渲染第 {self.current_page + 1} 页...")
+                    if not self.content_display.tile_size:
+                        self.prefetch_pages()
+
+                    # 设置当前面键值并加载标记和标签
+                    key = f"{self.current_book_path}_{self.current_page}"
+                    self.content_display.set_current_page(key)
+                    self.load_labels()
 
-                    # 渲染页面
-                    page = self.current_doc[self.current_page]
-                    zoom_matrix = fitz.Matrix(self.zoom_factor, self.zoom_factor)
-                    pix = page.get_pixmap(matrix=zoom_matrix)
+                    self.content_display.update()
 
-                    # 转换为QImage并显示
-                    img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888)
-                    pixmap = QPixmap.fromImage(img)
-                    self.content_display.setPixmap(pixmap)
+            elif isinstance(self.current_doc, TxtDocument):
+                self.waiting_txt_page = self.has_page(self.current_page) and \
+                    not self.current_doc.is_indexed(self.current_page)
+                if self.waiting_txt_page:
+                    # 索引还没建立到这一页，先显示提示，索引到达后在on_txt_indexed中显示
+                    self.update_page_label()
+                    self.content_display.setText(f"正在建立分页索引，第 {self.current_page + 1} 页稍后显示...")
+                elif self.has_page(self.current_page):
+                    self.update_page_label()
+                    self.show_txt_page()
 
                     # 设置当前面键值并加载标记和标签
                     key = f"{self.current_book_path}_{self.current_page}"
@@ -1406,6 +2249,162 @@ class EbookManager(QMainWindow):
         except Exception as e:
             print(f"显示当前页面时出错: {e}")
 
+    def render_key(self, page_num, zoom, tile=None):
+        """当前书籍某一页(或分块)的缓存键"""
+        return PageCache.make_key(self.current_book_path, page_num, zoom, tile, self.is_gray_mode())
+
+    def request_render(self, page_num, zoom, priority, tile=None):
+        """请求后台渲染当前书籍的页面或分块"""
+        self.render_pool.request(self.current_book_path, self.current_doc.name, page_num, zoom,
+                                 priority=priority, tile=tile, gray=self.is_gray_mode(),
+                                 layout=self.doc_layout, location=self.page_location(page_num))
+
+    def is_gray_mode(self):
+        return self.current_book_path in self.gray_books
+
+    def toggle_gray_mode(self, checked):
+        """切换当前书籍的灰度渲染，适合纯文字书籍，渲染内存减少三分之二"""
+        if not self.current_book_path:
+            self.gray_btn.setChecked(False)
+            return
+        if checked:
+            self.gray_books.add(self.current_book_path)
+        else:
+            self.gray_books.discard(self.current_book_path)
+        self.page_source = None  # 不再用另一种颜色的渲染结果占位
+        self.show_current_page()
+
+    def prefetch_pages(self):
+        """在后台预渲染当前页前后的页面，翻页时直接使用"""
+        try:
+            if not self.current_doc.name:
+                return
+            # 离当前页越近越先渲染，同样距离时先渲染后面的页面
+            for offset in range(1, PREFETCH_PAGES + 1):
+                for page_num in (self.current_page + offset, self.current_page - offset):
+                    if (0 <= page_num < self.page_count() and
+                            self.render_key(page_num, self.zoom_factor) not in self.page_cache):
+                        self.request_render(page_num, self.zoom_factor, priority=offset)
+        except Exception as e:
+            print(f"预渲染页面时出错: {e}")
+
+    def on_page_rendered(self, book_path, page_num, zoom, gray, rendered):
+        """后台渲染完成：放入缓存，如果是当前页面就显示出来"""
+        if book_path != self.current_book_path or gray != self.is_gray_mode():
+            return
+        is_current = page_num == self.current_page and isinstance(self.current_doc, fitz.Document)
+        if round(zoom, 3) == round(self.zoom_factor, 3):
+            self.page_cache.put(self.render_key(page_num, zoom), rendered)
+            if is_current:
+                self.set_page_pixmap(rendered, zoom)
+                self.statusBar().clearMessage()
+        elif is_current and zoom < self.zoom_factor and (not self.has_page_source() or self.page_source[2] < zoom):
+            # 低分辨率预览或较早缩放级别的结果，拉伸后先显示
+            self.page_source = (book_path, page_num, zoom, rendered)
+            self.show_placeholder()
+
+    def has_page_source(self):
+        """是否已有当前页面的渲染结果"""
+        return (self.page_source is not None and
+                self.page_source[:2] == (self.current_book_path, self.current_page))
+
+    def set_page_pixmap(self, rendered, zoom):
+        """显示渲染好的页面，只有当前显示的页面会转为QPixmap"""
+        self.page_source = (self.current_book_path, self.current_page, zoom, rendered)
+        self.content_display.clear_tiles()
+        self.content_display.setPixmap(rendered.to_pixmap())
+        self.content_display.update()
+
+    def show_placeholder(self):
+        """把当前页已有的渲染结果拉伸到目标缩放大小，清晰页面渲染好之前先显示"""
+        if not self.has_page_source():
+            return
+        _, _, zoom, rendered = self.page_source
+        scale = self.zoom_factor / zoom
+        width, height = round(rendered.width() * scale), round(rendered.height() * scale)
+        if self.use_tiles():
+            # 大页面不生成放大后的图片，绘制时直接拉伸
+            display = self.content_display
+            width, height = self.page_pixel_size()
+            if display.tile_size and (display.minimumWidth(), display.minimumHeight()) == (width, height):
+                display.tile_backdrop = rendered  # 已经在分块显示当前页，保留已有的分块
+                display.update()
+            else:
+                display.set_tiled_page(width, height, rendered)
+            return
+        self.content_display.clear_tiles()
+        self.content_display.setPixmap(QPixmap.fromImage(rendered.image.scaled(
+            width, height, Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.FastTransformation)))
+        self.content_display.update()
+
+    def use_tiles(self):
+        """当前页在当前缩放下是否需要分块渲染"""
+        width, height = self.page_pixel_size()
+        return width * height > TILED_PAGE_PIXELS
+
+    def page_pixel_size(self):
+        """当前页在当前缩放下的像素大小"""
+        if self.doc_layout is not None:
+            rect = fitz.Rect(0, 0, self.doc_layout[0], self.doc_layout[1])  # 可重排文档每页大小相同
+        else:
+            rect = self.current_doc[self.current_page].rect
+        return round(rect.width * self.zoom_factor), round(rect.height * self.zoom_factor)
+
+    def show_tiled_page(self):
+        """分块显示当前页：先拉伸已有的渲染结果或低分辨率预览，再加载视野内的分块"""
+        width, height = self.page_pixel_size()
+        if self.has_page_source():
+            self.content_display.set_tiled_page(width, height, self.page_source[3])
+        else:
+            self.content_display.set_tiled_page(width, height)
+            # 预览的像素数也限制在分块阈值以内
+            preview_zoom = min(self.zoom_factor * PREVIEW_ZOOM_RATIO,
+                               self.zoom_factor * (TILED_PAGE_PIXELS / 4 / (width * height)) ** 0.5)
+            self.request_render(self.current_page, preview_zoom, priority=0)
+        self.update_tiles()
+
+    def update_tiles(self, *_):
+        """请求视野内和边缘一圈的分块，移除离开视野的分块"""
+        display = self.content_display
+        if not display.tile_size or not isinstance(self.current_doc, fitz.Document):
+            return
+        viewport = self.scroll_area.viewport()
+        left = self.scroll_area.horizontalScrollBar().value()
+        top = self.scroll_area.verticalScrollBar().value()
+        cols = (display.minimumWidth() + TILE_SIZE - 1) // TILE_SIZE
+        rows = (display.minimumHeight() + TILE_SIZE - 1) // TILE_SIZE
+        first_col, last_col = left // TILE_SIZE, (left + viewport.width()) // TILE_SIZE
+        first_row, last_row = top // TILE_SIZE, (top + viewport.height()) // TILE_SIZE
+
+        self.render_pool.cancel_pending(tiles_only=True)  # 已经滚过去的分块不再渲染
+        wanted = set()
+        for row in range(max(0, first_row - 1), min(rows, last_row + 2)):
+            for col in range(max(0, first_col - 1), min(cols, last_col + 2)):
+                wanted.add((col, row))
+                if (col, row) in display.tiles:
+                    continue
+                rendered = self.page_cache.get(self.render_key(self.current_page, self.zoom_factor, (col, row)))
+                if rendered is not None:
+                    display.tiles[(col, row)] = rendered
+                else:
+                    inside = first_col <= col <= last_col and first_row <= row <= last_row
+                    self.request_render(self.current_page, self.zoom_factor,
+                                        priority=0 if inside else 1, tile=(col, row))
+        for tile in set(display.tiles) - wanted:
+            del display.tiles[tile]
+        self.visible_tiles = wanted
+        display.update()
+
+    def on_tile_rendered(self, book_path, page_num, zoom, gray, col, row, rendered):
+        """分块渲染完成：放入缓存，仍在视野内时显示"""
+        if book_path != self.current_book_path or gray != self.is_gray_mode():
+            return
+        self.page_cache.put(self.render_key(page_num, zoom, (col, row)), rendered)
+        if (page_num == self.current_page and round(zoom, 3) == round(self.zoom_factor, 3) and
+                self.content_display.tile_size and (col, row) in self.visible_tiles):
+            self.content_display.tiles[(col, row)] = rendered
+            self.content_display.update(QRect(col * TILE_SIZE, row * TILE_SIZE, rendered.width(), rendered.height()))
+
     def process_epub_images(self, content, item):
         """处理EPUB中的图片路径"""
         try:
@@ -1457,7 +2456,7 @@ class EbookManager(QMainWindow):
     def prev_page(self):
         """上一页"""
         try:
-            if self.current_doc and self.current_page > 0:
+            if self.current_doc is not None and self.current_page > 0:
                 # 先保存当前页面的标记
                 if self.marking_enabled:
                     self.content_display.save_current_marks()
@@ -1474,9 +2473,9 @@ class EbookManager(QMainWindow):
     def next_page(self):
         """下一页"""
         try:
-            if self.current_doc:
-                if isinstance(self.current_doc, fitz.Document):
-                    if self.current_page < len(self.current_doc) - 1:
+            if self.current_doc is not None:
+                if isinstance(self.current_doc, (fitz.Document, TxtDocument)):
+                    if self.has_page(self.current_page + 1):
                         # 先保存当前页面的标记
                         if self.marking_enabled:
                             self.content_display.save_current_marks()
@@ -1512,7 +2511,7 @@ class EbookManager(QMainWindow):
             # 保存缩放状态
             if self.current_book_path:
                 self.zoom_states[self.current_book_path] = self.zoom_factor
-            self.show_current_page()
+            self.zoom_page()
 
     def zoom_out(self):
         """缩小"""
@@ -1523,6 +2522,14 @@ class EbookManager(QMainWindow):
             # 保存缩放状态
             if self.current_book_path:
                 self.zoom_states[self.current_book_path] = self.zoom_factor
+            self.zoom_page()
+
+    def zoom_page(self):
+        """缩放时立即拉伸当前页面，停止缩放后再渲染清晰页面"""
+        if isinstance(self.current_doc, fitz.Document):
+            self.show_placeholder()
+            self.zoom_timer.start(ZOOM_SETTLE_MS)
+        else:
             self.show_current_page()
 
     def update_zoom_label(self):
@@ -1533,8 +2540,8 @@ class EbookManager(QMainWindow):
         """跳转到指定页面"""
         try:
             page_num = int(self.page_input.text()) - 1
-            if isinstance(self.current_doc, fitz.Document):
-                if 0 <= page_num < len(self.current_doc):
+            if isinstance(self.current_doc, (fitz.Document, TxtDocument)):
+                if self.has_page(page_num):
                     self.content_display.save_current_marks()  # 保存当前页面标记
                     self.current_page = page_num
                     # 保存新的页码到数据库
@@ -1549,6 +2556,9 @@ class EbookManager(QMainWindow):
         """保存当前页码到数据库"""
         try:
             if self.current_book_path and self.current_book_path in self.books:
+                if self.current_doc is None and \
+                        os.path.splitext(self.current_book_path)[1].lower() in CONVERT_FORMATS:
+                    return  # 还在转换中，没有有效的页码
                 book_id = self.books[self.current_book_path]['id']
 
                 # 检查是否已存在页码记录
@@ -1594,8 +2604,8 @@ class EbookManager(QMainWindow):
                 if result:
                     saved_page = result[0]
                     # 确保页码在有效范围内
-                    if isinstance(self.current_doc, fitz.Document):
-                        if 0 <= saved_page < len(self.current_doc):
+                    if isinstance(self.current_doc, (fitz.Document, TxtDocument)):
+                        if self.has_page(saved_page):
                             self.current_page = saved_page
                             return True
 
@@ -1938,6 +2948,8 @@ class EbookManager(QMainWindow):
                         del self.page_marks[key]
                 if file_path in self.zoom_states:
                     del self.zoom_states[file_path]
+                self.page_cache.discard_book(file_path)
+                self.gray_books.discard(file_path)
 
                 # 更新界面
                 self.update_book_tree()
@@ -2400,64 +3412,53 @@ class EbookManager(QMainWindow):
             self.content_display.update()
 
     def convert_and_open_ebook(self, file_path):
-        """转换并打开电子书"""
+        """打开需要转换的电子书：有转换好的PDF时直接打开，否则在后台优先转换，完成后自动打开"""
         try:
-            # 显示转换提示
-            self.statusBar().showMessage("正在转换电子书格式...", 2000)
-            QApplication.processEvents()
-
-            # 创建临时PDF文件路径
-            temp_dir = os.path.join(os.path.dirname(__file__), 'temp_pdf')
-            os.makedirs(temp_dir, exist_ok=True)
-            pdf_path = os.path.join(temp_dir, os.path.basename(file_path) + '.pdf')
-
-            # 如果已经有转换好的PDF，直接打开
-            if os.path.exists(pdf_path):
-                self.current_doc = fitz.open(pdf_path)
-                self.current_page = 0
-                self.show_current_page()
-                return
-
-            # 使用 calibre 的命令行工具转换
-            try:
-                import subprocess
-                # 添加转换参数以优化输出质量
-                cmd = [
-                    'ebook-convert',
-                    file_path,
-                    pdf_path,
-                    '--pdf-page-numbers',
-                    '--paper-size', 'a4',
-                    '--pdf-default-font-size', '12',
-                    '--pdf-serif-family', 'Times New Roman',
-                    '--pdf-sans-family', 'Arial',
-                    '--pdf-mono-family', 'Courier New',
-                    '--preserve-cover-aspect-ratio'
-                ]
-
-                result = subprocess.run(cmd, capture_output=True, text=True)
-
-                if result.returncode == 0:
-                    self.current_doc = fitz.open(pdf_path)
-                    self.current_page = 0
-                    self.show_current_page()
-                else:
-                    raise Exception(f"转换失败: {result.stderr}")
-
-            except FileNotFoundError:
-                QMessageBox.warning(
-                    self,
-                    '错误',
-                    '未找到 ebook-convert 工具。请安装 Calibre 软件。\n'
-                    '下载地址: https://calibre-ebook.com/download\n'
-                    '安装后需要重启程序。'
-                )
+            pdf_path = self.convert_queue.lookup(file_path)
+            if pdf_path:
+                self.set_document(fitz.open(pdf_path))
                 return
 
+            # 转换期间不显示上一本书的内容
+            self.set_document(None)
+            self.current_page = 0
+            self.content_display.clear_tiles()
+            self.content_display.setText("正在转换电子书格式，完成后自动打开...")
+            self.statusBar().showMessage("正在转换电子书格式...")
+            self.convert_queue.request(file_path, priority=0)
         except Exception as e:
             QMessageBox.warning(self, '错误', f'转换电子书失败: {str(e)}')
             print(f"转换电子详细错误: {e}")
 
+    def on_book_converted(self, file_path, pdf_path):
+        """后台转换完成；如果是正在等待打开的书就立即显示"""
+        if file_path != self.current_book_path or self.current_doc is not None:
+            return
+        try:
+            self.set_document(fitz.open(pdf_path))
+            self.statusBar().showMessage("电子书转换完成", 2000)
+            if not self.load_current_page():
+                self.current_page = 0
+            self.show_current_page()
+        except Exception as e:
+            QMessageBox.warning(self, '错误', f'打开转换后的电子书失败: {str(e)}')
+
+    def on_convert_failed(self, file_path, error):
+        print(f"转换电子书失败: {file_path}: {error}")
+        if file_path != self.current_book_path or self.current_doc is not None:
+            return
+        self.statusBar().clearMessage()
+        if self.convert_queue.tool_missing:
+            QMessageBox.warning(
+                self,
+                '错误',
+                '未找到 ebook-convert 工具。请安装 Calibre 软件。\n'
+                '下载地址: https://calibre-ebook.com/download\n'
+                '安装后需要重启程序。'
+            )
+        else:
+            QMessageBox.warning(self, '错误', f'转换电子书失败: {error}')
+
     def undo_mark(self):
         """撤销上一次标记"""
         try:
@@ -1,23 +1,41 @@
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QPushButton, QLabel, QFileDialog, QScrollArea,
                              QHBoxLayout, QSpinBox, QMessageBox, QProgressBar, QLineEdit, QTextEdit, QListWidget,
-                             QDialog, QListWidgetItem, QGroupBox)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer
+                             QDialog, QListWidgetItem, QGroupBox, QCheckBox, QInputDialog,
+                             QComboBox, QTimeEdit, QFormLayout)
+from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer, QTime
 from PyQt5.QtGui import QPixmap, QImage
 import cv2
 import numpy as np
 import pyautogui
 import sys
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Tuple
 import logging
 import random
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
+import hashlib
+import mmap
 import sqlite3
+import shutil
+import threading
 from contextlib import contextmanager
+from collections import deque
+
+try:
+    import psutil  # 可选，用于显示内存占用
+except ImportError:
+    psutil = None
+
+
+@dataclass
+class StepCandidate:
+    path: str
+    threshold: float = 0.8
+    goto: int = 0  # 命中后跳转的步骤序号(从1开始)，0表示顺序执行
 
 
 @dataclass
@@ -27,6 +45,22 @@ class ImageItem:
     min_delay: float = 0.5  # 最小延时
     max_delay: float = 2.0  # 最大延时
     timeout: float = 60.0  # 默认改为60秒
+    candidates: List[StepCandidate] = field(default_factory=list)  # 任一命中即可的其他模板
+    optional: bool = False  # 可选步骤：超时或下一步先出现时直接跳过
+    goto: int = 0  # 命中后跳转的步骤序号，0表示顺序执行
+    timeout_goto: int = 0  # 超时后跳转的步骤序号，0表示顺序执行
+
+    def candidates_to_json(self):
+        return json.dumps([
+            {'path': c.path, 'threshold': c.threshold, 'goto': c.goto}
+            for c in self.candidates
+        ], ensure_ascii=False)
+
+    @staticmethod
+    def candidates_from_json(text):
+        if not text:
+            return []
+        return [StepCandidate(**c) for c in json.loads(text)]
 
 
 @dataclass
@@ -49,7 +83,14 @@ class Task:
                     'threshold': img.threshold,
                     'min_delay': img.min_delay,
                     'max_delay': img.max_delay,
-                    'timeout': img.timeout
+                    'timeout': img.timeout,
+                    'candidates': [
+                        {'path': c.path, 'threshold': c.threshold, 'goto': c.goto}
+                        for c in img.candidates
+                    ],
+                    'optional': img.optional,
+                    'goto': img.goto,
+                    'timeout_goto': img.timeout_goto
                 } for img in self.images
             ]
         }
@@ -62,7 +103,11 @@ class Task:
                 threshold=img['threshold'],
                 min_delay=img['min_delay'],
                 max_delay=img['max_delay'],
-                timeout=img['timeout']
+                timeout=img['timeout'],
+                candidates=[StepCandidate(**c) for c in img.get('candidates', [])],
+                optional=img.get('optional', False),
+                goto=img.get('goto', 0),
+                timeout_goto=img.get('timeout_goto', 0)
             ) for img in data['images']
         ]
         return cls(
@@ -74,115 +119,696 @@ class Task:
         )
 
 
+# 任务包格式：魔数 + 头长度(uint32) + JSON头 + 对齐后的数据区
+BUNDLE_MAGIC = b'TXSBPKG1'
+BUNDLE_ALIGN = 64
+BUNDLE_SCHEME = 'txsb-bundle://'
+BUNDLE_DIR = 'task_bundles'
+
+
+def make_bundle_path(bundle_path, index):
+    """生成指向任务包内模板的路径"""
+    return f"{BUNDLE_SCHEME}{os.path.abspath(bundle_path)}#{index}"
+
+
+def parse_bundle_path(path):
+    """解析任务包模板路径，普通文件路径返回None"""
+    if not path.startswith(BUNDLE_SCHEME):
+        return None
+    bundle_path, index = path[len(BUNDLE_SCHEME):].rsplit('#', 1)
+    return bundle_path, int(index)
+
+
+class TaskBundle:
+    """任务包：一个文件内保存任务信息和全部模板图像"""
+
+    _opened = {}
+
+    def __init__(self, bundle_path):
+        self.bundle_path = os.path.abspath(bundle_path)
+        with open(self.bundle_path, 'rb') as f:
+            if f.read(len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+                raise ValueError(f"不是有效的任务包: {bundle_path}")
+            header_len = int.from_bytes(f.read(4), 'little')
+            self.header = json.loads(f.read(header_len).decode('utf-8'))
+            # 整个文件只读映射，模板直接从映射内存中取用；
+            # frombuffer得到的数组会占用映射，还有模板在使用时close()无法释放，不会留下悬空的模板
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data_start = self._align(len(BUNDLE_MAGIC) + 4 + header_len)
+        self._data = np.frombuffer(self._mmap, dtype=np.uint8)
+
+    @classmethod
+    def open(cls, bundle_path):
+        """打开任务包，同一文件只映射一次"""
+        key = os.path.abspath(bundle_path)
+        if key not in cls._opened:
+            cls._opened[key] = cls(key)
+        return cls._opened[key]
+
+    def close(self):
+        """释放文件映射，Windows下映射没有释放时无法覆盖或删除任务包
+
+        还有模板引用映射内存时无法释放，保持打开并返回False
+        """
+        self._data = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            self._data = np.frombuffer(self._mmap, dtype=np.uint8)
+            return False
+        TaskBundle._opened.pop(self.bundle_path, None)
+        return True
+
+    @classmethod
+    def release(cls, bundle_path):
+        """释放已打开的任务包，没有打开时返回True"""
+        bundle = cls._opened.get(os.path.abspath(bundle_path))
+        return bundle is None or bundle.close()
+
+    @classmethod
+    def close_all(cls):
+        for bundle in list(cls._opened.values()):
+            bundle.close()
+
+    @staticmethod
+    def _align(offset):
+        return (offset + BUNDLE_ALIGN - 1) // BUNDLE_ALIGN * BUNDLE_ALIGN
+
+    @staticmethod
+    def write(task: Task, bundle_path, with_gray=False):
+        """把任务和模板图像导出为任务包"""
+        entries = []
+        blobs = []
+        offset = 0
+        task_data = task.to_dict()
+        # 多个步骤或候选引用同一模板时只保存一次：路径/图像内容哈希 -> 条目序号
+        path_entries = {}
+        digest_entries = {}
+
+        def add_entry(path):
+            nonlocal offset
+            if path in path_entries:
+                return path_entries[path]
+            image_bytes = read_template_bytes(path)
+            digest = hashlib.sha1(image_bytes).hexdigest()
+            if digest in digest_entries:
+                path_entries[path] = digest_entries[digest]
+                return path_entries[path]
+            ref = parse_bundle_path(path)
+            if ref is not None:
+                name = TaskBundle.open(ref[0]).header['entries'][ref[1]]['name']
+            else:
+                name = os.path.basename(path)
+            entry = {'name': name, 'image': [offset, len(image_bytes)]}
+            blobs.append((offset, image_bytes))
+            offset = TaskBundle._align(offset + len(image_bytes))
+
+            if with_gray:
+                # 预先计算灰度模板，导入后无需再解码
+                decoded = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+                if decoded is None:
+                    raise ValueError(f"无法读取图像: {path}")
+                gray = np.ascontiguousarray(decoded)
+                entry['gray'] = [offset, gray.shape[0], gray.shape[1]]
+                blobs.append((offset, gray.tobytes()))
+                offset = TaskBundle._align(offset + gray.nbytes)
+
+            entries.append(entry)
+            path_entries[path] = digest_entries[digest] = len(entries) - 1
+            return len(entries) - 1
+
+        for img_data in task_data['images']:
+            img_data['path'] = add_entry(img_data['path'])
+            for candidate in img_data['candidates']:
+                candidate['path'] = add_entry(candidate['path'])
+
+        # 模板都已读出，覆盖前释放原任务包的映射
+        if not TaskBundle.release(bundle_path):
+            raise ValueError(f"任务包正在使用中，无法覆盖: {bundle_path}")
+
+        header = json.dumps({'task': task_data, 'entries': entries},
+                            ensure_ascii=False).encode('utf-8')
+        data_start = TaskBundle._align(len(BUNDLE_MAGIC) + 4 + len(header))
+
+        with open(bundle_path, 'wb') as f:
+            f.write(BUNDLE_MAGIC)
+            f.write(len(header).to_bytes(4, 'little'))
+            f.write(header)
+            for blob_offset, blob in blobs:
+                f.seek(data_start + blob_offset)
+                f.write(blob)
+
+    def to_task(self) -> Task:
+        """从任务包构建任务，模板路径指向任务包内部"""
+        task_data = json.loads(json.dumps(self.header['task']))
+        for img in task_data['images']:
+            img['path'] = make_bundle_path(self.bundle_path, img['path'])
+            for candidate in img.get('candidates', []):
+                candidate['path'] = make_bundle_path(self.bundle_path, candidate['path'])
+        return Task.from_dict(task_data)
+
+    def _slice(self, start, size):
+        start += self.data_start
+        return self._data[start:start + size]
+
+    def image_bytes(self, index):
+        """获取模板原始图像数据"""
+        start, size = self.header['entries'][index]['image']
+        return self._slice(start, size).tobytes()
+
+    def template(self, index):
+        """获取模板：有预计算灰度图时直接返回映射内存，否则解码原图"""
+        entry = self.header['entries'][index]
+        if 'gray' in entry:
+            start, h, w = entry['gray']
+            return np.asarray(self._slice(start, h * w)).reshape(h, w)
+        start, size = entry['image']
+        return cv2.imdecode(np.asarray(self._slice(start, size)), cv2.IMREAD_COLOR)
+
+
+def task_bundle_paths(task: Task):
+    """任务中模板引用的所有任务包文件"""
+    paths = set()
+    for img in task.images:
+        for path in [img.path] + [c.path for c in img.candidates]:
+            ref = parse_bundle_path(path)
+            if ref is not None:
+                paths.add(ref[0])
+    return paths
+
+
+def read_template_bytes(path):
+    """读取模板图像文件内容，支持任务包内的模板"""
+    ref = parse_bundle_path(path)
+    if ref is not None:
+        return TaskBundle.open(ref[0]).image_bytes(ref[1])
+    if not os.path.exists(path):
+        raise ValueError(f"无法读取图像: {path}")
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def load_template(path):
+    """读取匹配用模板，普通文件用cv2.imread，任务包模板从映射内存读取"""
+    ref = parse_bundle_path(path)
+    if ref is None:
+        return cv2.imread(path)
+    try:
+        return TaskBundle.open(ref[0]).template(ref[1])
+    except (OSError, ValueError, IndexError, KeyError):
+        return None
+
+
+def load_template_pixmap(path):
+    """读取用于界面显示的模板图像"""
+    ref = parse_bundle_path(path)
+    if ref is None:
+        return QPixmap(path)
+    pixmap = QPixmap()
+    try:
+        pixmap.loadFromData(TaskBundle.open(ref[0]).image_bytes(ref[1]))
+    except (OSError, ValueError, IndexError, KeyError):
+        pass
+    return pixmap
+
+
+def preload_templates(images: List[ImageItem]):
+    """预先读取任务用到的全部模板，供下一次运行直接使用"""
+    templates = {}
+    for img in images:
+        for path in [img.path] + [c.path for c in img.candidates]:
+            if path not in templates:
+                templates[path] = load_template(path)
+    return templates
+
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+SCHEDULE_MODES = {
+    'queue': '排队执行一次',
+    'interval': '间隔重复',
+    'daily': '每天定时',
+}
+
+
+@dataclass
+class ScheduleEntry:
+    task_id: int
+    mode: str = 'queue'  # queue / interval / daily
+    interval_minutes: int = 0  # 间隔重复的分钟数，0表示结束后立即再次运行
+    daily_time: str = '00:00'  # 每天定时运行的时间 HH:MM
+    max_rounds: int = 0  # 轮次限制，0表示使用任务自身的循环次数
+    time_limit: int = 0  # 单次运行时间限制(分钟)，0表示不限制
+    enabled: bool = True
+    next_run: str = ''
+    last_run: str = ''
+    position: int = 0
+    id: int = 0
+
+
+class TaskScheduler:
+    """计划任务调度，计划状态保存在数据库中，重启后继续生效"""
+
+    def __init__(self, db):
+        self.db = db
+
+    @staticmethod
+    def next_daily(daily_time, now):
+        hour, minute = map(int, daily_time.split(':'))
+        run_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if run_time <= now:
+            run_time += timedelta(days=1)
+        return run_time
+
+    def add(self, entry: ScheduleEntry, now=None):
+        """添加计划，排队和间隔任务立即可运行，定时任务等到下一个时间点"""
+        now = now or datetime.now()
+        if entry.mode == 'daily':
+            entry.next_run = self.next_daily(entry.daily_time, now).strftime(TIME_FORMAT)
+        else:
+            entry.next_run = now.strftime(TIME_FORMAT)
+        entry.position = max([e.position for e in self.db.get_schedules()], default=0) + 1
+        return self.db.add_schedule(entry)
+
+    def next_due(self, now=None):
+        """返回已到期的下一个计划，没有则返回None"""
+        now_str = (now or datetime.now()).strftime(TIME_FORMAT)
+        due = [e for e in self.db.get_schedules()
+               if e.enabled and e.next_run and e.next_run <= now_str]
+        return min(due, key=lambda e: (e.next_run, e.position, e.id), default=None)
+
+    def upcoming(self):
+        """返回最近将要运行的计划，用于提前加载模板"""
+        entries = [e for e in self.db.get_schedules() if e.enabled and e.next_run]
+        return min(entries, key=lambda e: (e.next_run, e.position, e.id), default=None)
+
+    def mark_started(self, entry: ScheduleEntry, now=None):
+        """记录开始运行并计算下一次运行时间"""
+        now = now or datetime.now()
+        entry.last_run = now.strftime(TIME_FORMAT)
+        if entry.mode == 'interval':
+            entry.next_run = (now + timedelta(minutes=entry.interval_minutes)).strftime(TIME_FORMAT)
+        elif entry.mode == 'daily':
+            entry.next_run = self.next_daily(entry.daily_time, now).strftime(TIME_FORMAT)
+        else:
+            entry.enabled = False
+            entry.next_run = ''
+        self.db.update_schedule(entry)
+
+
+class ScreenCapture:
+    """屏幕截图：记录帧序号，截图后没有输入且未过期时复用上一帧"""
+
+    def __init__(self, max_age: float = 0.5):
+        self.max_age = max_age  # 可复用的最长帧龄(秒)
+        self.frame = None
+        self.frame_seq = 0
+        self.frame_time = 0.0
+        self.input_seq = 0  # 最近一次输入时的帧序号
+        self.captured = 0
+        self.reused = 0
+
+    def capture(self):
+        """重新截图"""
+        self.frame = np.array(pyautogui.screenshot())
+        self.frame_seq += 1
+        self.frame_time = time.time()
+        self.captured += 1
+        return self.frame
+
+    def mark_input(self):
+        """记录一次点击等输入，之前的截图不再可复用"""
+        self.input_seq = self.frame_seq
+
+    def is_fresh(self):
+        return (self.frame is not None and self.frame_seq > self.input_seq
+                and time.time() - self.frame_time <= self.max_age)
+
+    def latest(self):
+        """上一帧仍有效时直接返回，否则重新截图"""
+        if self.is_fresh():
+            self.reused += 1
+            return self.frame
+        return self.capture()
+
+
+def windows_memory_mb():
+    """Windows下当前进程的工作集大小(MB)"""
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ('cb', wintypes.DWORD),
+            ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t),
+            ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t),
+            ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    kernel32 = ctypes.windll.kernel32
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    if not kernel32.K32GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.WorkingSetSize / 1024 / 1024
+
+
+def current_memory_mb():
+    """当前进程常驻内存(MB)，不是峰值；无法获取时返回None"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    try:
+        if sys.platform == 'win32':
+            return windows_memory_mb()
+        # Linux: statm第二项为常驻内存页数
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class RunMetrics:
+    """运行性能计数：截图帧率、匹配延迟、每轮CPU时间、检测与等待时间"""
+
+    def __init__(self, window: int = 200):
+        self.capture_times = deque(maxlen=window)  # 最近截图的时间点
+        self.match_latencies = deque(maxlen=window)  # 最近匹配耗时(秒)
+        self.detect_time = 0.0
+        self.sleep_time = 0.0
+        self.round_cpu_start = time.thread_time()
+        self.last_round_cpu = 0.0
+
+    def start(self):
+        """在运行检测的线程中调用：thread_time只统计当前线程，开始和结束必须在同一线程读取"""
+        self.round_cpu_start = time.thread_time()
+        self.last_round_cpu = 0.0
+
+    def record_capture(self, seconds=0.0):
+        """记录一次截图，截图耗时计入检测时间，不计入匹配延迟"""
+        self.capture_times.append(time.perf_counter())
+        self.detect_time += seconds
+
+    def record_match(self, seconds):
+        self.match_latencies.append(seconds)
+        self.detect_time += seconds
+
+    def record_sleep(self, seconds):
+        """seconds为实际等待的时间"""
+        self.sleep_time += seconds
+
+    def end_round(self):
+        """记录一轮结束时的CPU时间"""
+        now = time.thread_time()
+        self.last_round_cpu = now - self.round_cpu_start
+        self.round_cpu_start = now
+
+    def snapshot(self):
+        """当前指标，用于界面显示"""
+        fps = 0.0
+        if len(self.capture_times) >= 2:
+            span = self.capture_times[-1] - self.capture_times[0]
+            if span > 0:
+                fps = (len(self.capture_times) - 1) / span
+
+        latencies = {}
+        if self.match_latencies:
+            values = np.percentile(np.array(self.match_latencies) * 1000, [50, 90, 99])
+            latencies = {'p50': values[0], 'p90': values[1], 'p99': values[2]}
+
+        return {
+            'fps': fps,
+            'latency_ms': latencies,
+            'round_cpu': time.thread_time() - self.round_cpu_start,
+            'last_round_cpu': self.last_round_cpu,
+            'detect_time': self.detect_time,
+            'sleep_time': self.sleep_time,
+            'memory_mb': current_memory_mb(),
+        }
+
+
+class TemplatePreloadThread(QThread):
+    """在后台预先读取计划任务的模板，避免界面卡顿"""
+    loaded_signal = pyqtSignal(int, dict)  # 任务ID, 模板缓存
+
+    def __init__(self, task_id, images: List[ImageItem]):
+        super().__init__()
+        self.task_id = task_id
+        self.images = images
+
+    def run(self):
+        try:
+            self.loaded_signal.emit(self.task_id, preload_templates(self.images))
+        except Exception as e:
+            logging.error(f"预加载计划任务模板失败: {str(e)}")
+
+
 class ImageProcessThread(QThread):
     progress_signal = pyqtSignal(int)
     result_signal = pyqtSignal(str)
     finished_signal = pyqtSignal()
     image_signal = pyqtSignal(QPixmap)
+    metrics_signal = pyqtSignal(dict)
 
-    def __init__(self, images: List[ImageItem], loop_count: int):
+    def __init__(self, images: List[ImageItem], loop_count: int, templates=None, time_limit: float = 0):
         super().__init__()
         self.images = images
         self.loop_count = loop_count
         self.is_running = True
+        self.stop_event = threading.Event()  # 停止时打断正在进行的等待
+        self.templates = templates if templates is not None else {}  # 模板缓存: 路径 -> 图像
+        self.time_limit = time_limit
+        self.deadline = None  # 在run()开始时按运行时间限制计算
+        self.screen = ScreenCapture()
+        self.metrics = RunMetrics()
+        self.last_metrics_emit = 0.0
 
     def stop(self):
         self.is_running = False
+        self.stop_event.set()
+
+    def sleep(self, seconds):
+        """等待并计入实际等待的时间；停止或到达运行时间限制时立即结束等待"""
+        start = time.perf_counter()
+        if self.deadline is not None:
+            seconds = min(seconds, max(0.0, self.deadline - time.time()))
+        self.stop_event.wait(seconds)
+        self.metrics.record_sleep(time.perf_counter() - start)
+        self.check_time_limit()
+        self.emit_metrics()
+
+    def emit_metrics(self, force=False):
+        """每秒最多发送一次性能指标"""
+        now = time.time()
+        if force or now - self.last_metrics_emit >= 1.0:
+            self.last_metrics_emit = now
+            metrics = self.metrics.snapshot()
+            metrics['captured'] = self.screen.captured
+            metrics['reused'] = self.screen.reused
+            self.metrics_signal.emit(metrics)
+
+    def check_time_limit(self):
+        """超过运行时间限制时停止"""
+        if self.deadline is not None and self.is_running and time.time() >= self.deadline:
+            self.result_signal.emit("\n已达到运行时间限制，停止任务")
+            self.stop()
+
+    def get_template(self, path):
+        """读取模板，同一路径只读取一次"""
+        if path not in self.templates:
+            self.templates[path] = load_template(path)
+        return self.templates[path]
+
+    def step_targets(self, img_item: ImageItem):
+        """步骤需要同时检测的模板列表: (路径, 模板, 阈值, 命中后跳转)"""
+        targets = []
+        for path, threshold, goto in [(img_item.path, img_item.threshold, img_item.goto)] + \
+                [(c.path, c.threshold, c.goto) for c in img_item.candidates]:
+            template = self.get_template(path)
+            if template is None:
+                self.result_signal.emit(f"无法读取图像: {path}")
+                continue
+            targets.append((path, template, threshold, goto))
+        return targets
+
+    @staticmethod
+    def match_targets(screen, targets):
+        """在同一张截图上检测所有模板，返回(超过阈值且匹配度最高的命中, 最佳匹配度)"""
+        converted = {}
+        hit = None
+        best_val = 0.0
+        for target in targets:
+            template = target[1]
+            # 任务包中的预计算灰度模板按灰度匹配
+            mode = cv2.COLOR_RGB2GRAY if template.ndim == 2 else cv2.COLOR_RGB2BGR
+            if mode not in converted:
+                converted[mode] = cv2.cvtColor(screen, mode)
+
+            result = cv2.matchTemplate(converted[mode], template, cv2.TM_CCOEFF_NORMED)
+            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+            best_val = max(best_val, max_val)
+            if max_val > target[2] and (hit is None or max_val > hit[1]):
+                hit = (target, max_val, max_loc)
+        return hit, best_val
+
+    def resolve_goto(self, goto, step):
+        """跳转序号(从1开始)转换为步骤下标，0或超出范围时顺序执行下一步"""
+        if 1 <= goto <= len(self.images):
+            return goto - 1
+        return step + 1
 
     def run(self):
+        # 计时从线程真正开始运行算起，CPU时间也在本线程上读取
+        self.metrics.start()
+        if self.time_limit > 0:
+            self.deadline = time.time() + self.time_limit
         try:
             current_loop = 1
+            total_steps = len(self.images)
 
             while current_loop <= self.loop_count and self.is_running:
                 self.result_signal.emit(f"\n开始执行第 {current_loop}/{self.loop_count} 轮任务")
 
-                for i, img_item in enumerate(self.images):
-                    if not self.is_running:
-                        break
+                step = 0
+                while step < total_steps and self.is_running:
+                    img_item = self.images[step]
+                    self.check_time_limit()
 
                     # 计算总体进度
-                    total_progress = int(((current_loop - 1) * len(self.images) + i) /
-                                         (self.loop_count * len(self.images)) * 100)
+                    total_progress = int(((current_loop - 1) * total_steps + step) /
+                                         (self.loop_count * total_steps) * 100)
                     self.progress_signal.emit(total_progress)
 
-                    # 读取并显示当前处理的图片
-                    template = cv2.imread(img_item.path)
-                    if template is None:
-                        self.result_signal.emit(f"无法读取图像: {img_item.path}")
+                    targets = self.step_targets(img_item)
+                    if not targets:
+                        step += 1
                         continue
 
                     # 发送图片信号用于显示
-                    pixmap = QPixmap(img_item.path)
+                    pixmap = load_template_pixmap(img_item.path)
                     self.image_signal.emit(pixmap)
 
+                    # 可选步骤同时检测下一步的模板，下一步先出现时不再等待超时
+                    skip_to = self.resolve_goto(img_item.timeout_goto, step)
+                    lookahead = []
+                    if img_item.optional and skip_to < total_steps:
+                        lookahead = self.step_targets(self.images[skip_to])
+
                     # 开计时
                     start_time = time.time()
-                    found = False
-
-                    # 循检测直到超时
-                    while time.time() - start_time < img_item.timeout and not found and self.is_running:
-                        # 获取屏幕截图
-                        screen = np.array(pyautogui.screenshot())
-                        screen = cv2.cvtColor(screen, cv2.COLOR_RGB2BGR)
-
-                        # 模板匹配
-                        result = cv2.matchTemplate(screen, template, cv2.TM_CCOEFF_NORMED)
-                        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-
-                        if max_val > img_item.threshold:
-                            found = True
-                            h, w = template.shape[:2]
-
-                            # 修改随机点击位置的计算方式
-                            # 确保点击位置在匹配到的图像区域内
-                            click_x = max_loc[0] + random.randint(5, w - 5)  # 留出5像素边距
-                            click_y = max_loc[1] + random.randint(5, h - 5)  # 留出5像素边距
-
-                            # 随机延时
-                            random_delay = random.uniform(img_item.min_delay, img_item.max_delay)
-
-                            try:
-                                # 添加更详细的日志
-                                self.result_signal.emit(
-                                    f"第 {current_loop}/{self.loop_count} 轮 - "
-                                    f"处理第 {i + 1}/{len(self.images)} 张图片:\n"
-                                    f"匹配位置: ({max_loc[0]}, {max_loc[1]})\n"
-                                    f"图像大小: {w}x{h}\n"
-                                    f"随机点击: ({click_x}, {click_y})\n"
-                                    f"匹配度: {max_val:.2f}\n"
-                                    f"等待时间: {random_delay:.1f}秒\n"
-                                    f"识别用时: {time.time() - start_time:.1f}秒"
-                                )
-
-                                # 平滑移动到随机位置
-                                pyautogui.moveTo(click_x, click_y, duration=0.2)
-                                time.sleep(0.1)  # 短暂停顿
-                                pyautogui.click()
-
-                            except Exception as e:
-                                self.result_signal.emit(f"击失败: {str(e)}")
-
-                            time.sleep(random_delay)
+                    hit = None
+                    skipped = False
+                    best_val = 0.0
+
+                    # 循检测直到超时，每次截图同时检测所有候选模板
+                    first_attempt = True
+                    while time.time() - start_time < img_item.timeout and self.is_running:
+                        self.check_time_limit()
+                        if not self.is_running:
+                            break
+
+                        # 获取屏幕截图，每步的第一次检测优先复用上一帧
+                        if first_attempt and self.screen.is_fresh():
+                            screen = self.screen.latest()
                         else:
-                            # 短暂等待后继续检测
-                            time.sleep(0.1)
-
-                    if not found:
+                            capture_start = time.perf_counter()
+                            screen = self.screen.capture()
+                            self.metrics.record_capture(time.perf_counter() - capture_start)
+                        first_attempt = False
+
+                        # 匹配延迟只计模板匹配，不含截图
+                        detect_start = time.perf_counter()
+                        hit, max_val = self.match_targets(screen, targets)
+                        best_val = max(best_val, max_val)
+                        if hit is None and lookahead:
+                            skipped = self.match_targets(screen, lookahead)[0] is not None
+                        self.metrics.record_match(time.perf_counter() - detect_start)
+                        if hit is not None or skipped:
+                            break
+
+                        # 短暂等待后继续检测
+                        self.sleep(0.1)
+
+                    if hit is not None:
+                        (path, template, threshold, goto), max_val, max_loc = hit
+                        h, w = template.shape[:2]
+
+                        # 修改随机点击位置的计算方式
+                        # 确保点击位置在匹配到的图像区域内
+                        click_x = max_loc[0] + random.randint(5, w - 5)  # 留出5像素边距
+                        click_y = max_loc[1] + random.randint(5, h - 5)  # 留出5像素边距
+
+                        # 随机延时
+                        random_delay = random.uniform(img_item.min_delay, img_item.max_delay)
+
+                        try:
+                            # 添加更详细的日志
+                            self.result_signal.emit(
+                                f"第 {current_loop}/{self.loop_count} 轮 - "
+                                f"处理第 {step + 1}/{total_steps} 张图片:\n"
+                                f"命中模板: {os.path.basename(path)}\n"
+                                f"匹配位置: ({max_loc[0]}, {max_loc[1]})\n"
+                                f"图像大小: {w}x{h}\n"
+                                f"随机点击: ({click_x}, {click_y})\n"
+                                f"匹配度: {max_val:.2f}\n"
+                                f"等待时间: {random_delay:.1f}秒\n"
+                                f"识别用时: {time.time() - start_time:.1f}秒"
+                            )
+
+                            # 平滑移动到随机位置
+                            self.screen.mark_input()
+                            pyautogui.moveTo(click_x, click_y, duration=0.2)
+                            self.sleep(0.1)  # 短暂停顿
+                            pyautogui.click()
+
+                        except Exception as e:
+                            self.result_signal.emit(f"击失败: {str(e)}")
+
+                        self.sleep(random_delay)
+                        step = self.resolve_goto(goto, step)
+
+                    elif skipped:
                         self.result_signal.emit(
                             f"第 {current_loop}/{self.loop_count} 轮 - "
-                            f"处理第 {i + 1}/{len(self.images)} 张图片:\n"
-                            f"超时未找到匹配图像 (超时时间: {img_item.timeout}秒)\n"
-                            f"最佳匹配度: {max_val:.2f}"
+                            f"可选步骤 {step + 1}/{total_steps} 未出现，下一步已出现，直接跳过"
                         )
-
+                        step = skip_to
+
+                    else:
+                        if img_item.optional:
+                            self.result_signal.emit(
+                                f"第 {current_loop}/{self.loop_count} 轮 - "
+                                f"可选步骤 {step + 1}/{total_steps} 未出现，跳过"
+                            )
+                        elif self.is_running:
+                            self.result_signal.emit(
+                                f"第 {current_loop}/{self.loop_count} 轮 - "
+                                f"处理第 {step + 1}/{total_steps} 张图片:\n"
+                                f"超时未找到匹配图像 (超时时间: {img_item.timeout}秒)\n"
+                                f"最佳匹配度: {best_val:.2f}"
+                            )
+                        step = skip_to
+
+                self.metrics.end_round()
+                self.emit_metrics(force=True)
                 if self.is_running:
                     current_loop += 1
                     if current_loop <= self.loop_count:
                         self.result_signal.emit(f"\n当前轮次完成，等待3秒后开始下一轮...")
-                        time.sleep(3)  # 每轮之间等待3秒
+                        self.sleep(3)  # 每轮之间等待3秒
 
             self.progress_signal.emit(100)
+            self.emit_metrics(force=True)
             self.result_signal.emit(f"\n所有循环执行完成，共执行 {current_loop - 1} 轮")
+            self.result_signal.emit(
+                f"截图 {self.screen.captured} 次，复用上一帧 {self.screen.reused} 次"
+            )
             self.finished_signal.emit()
 
         except Exception as e:
@@ -222,6 +848,37 @@ class DatabaseManager:
                     FOREIGN KEY (task_id) REFERENCES tasks (id)
                 )
             ''')
+            # 旧数据库补充分支步骤相关的列
+            cursor.execute('PRAGMA table_info(images)')
+            columns = {row[1] for row in cursor.fetchall()}
+            for column, column_type in [('candidates', 'TEXT'), ('optional', 'INTEGER DEFAULT 0'),
+                                        ('goto', 'INTEGER DEFAULT 0'), ('timeout_goto', 'INTEGER DEFAULT 0')]:
+                if column not in columns:
+                    cursor.execute(f'ALTER TABLE images ADD COLUMN {column} {column_type}')
+            # 创建计划任务表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schedules (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id INTEGER NOT NULL,
+                    mode TEXT NOT NULL,
+                    interval_minutes INTEGER DEFAULT 0,
+                    daily_time TEXT,
+                    max_rounds INTEGER DEFAULT 0,
+                    time_limit INTEGER DEFAULT 0,
+                    enabled INTEGER DEFAULT 1,
+                    next_run TEXT,
+                    last_run TEXT,
+                    position INTEGER DEFAULT 0,
+                    FOREIGN KEY (task_id) REFERENCES tasks (id)
+                )
+            ''')
+            # 创建设置表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
             conn.commit()
 
     @contextmanager
@@ -248,9 +905,11 @@ class DatabaseManager:
             # 保存图像信息
             for img in task.images:
                 cursor.execute('''
-                    INSERT INTO images (task_id, path, threshold, min_delay, max_delay, timeout)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (task_id, img.path, img.threshold, img.min_delay, img.max_delay, img.timeout))
+                    INSERT INTO images (task_id, path, threshold, min_delay, max_delay, timeout,
+                                        candidates, optional, goto, timeout_goto)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (task_id, img.path, img.threshold, img.min_delay, img.max_delay, img.timeout,
+                      img.candidates_to_json(), int(img.optional), img.goto, img.timeout_goto))
 
             conn.commit()
             return task_id
@@ -267,17 +926,25 @@ class DatabaseManager:
                 raise ValueError(f"找不到ID为{task_id}的任务")
 
             # 获取图像信息
-            cursor.execute('SELECT * FROM images WHERE task_id = ?', (task_id,))
+            cursor.execute('''
+                SELECT path, threshold, min_delay, max_delay, timeout,
+                       candidates, optional, goto, timeout_goto
+                FROM images WHERE task_id = ? ORDER BY id
+            ''', (task_id,))
             images_data = cursor.fetchall()
 
             # 构建图像列表
             images = [
                 ImageItem(
-                    path=img[2],
-                    threshold=img[3],
-                    min_delay=img[4],
-                    max_delay=img[5],
-                    timeout=img[6]
+                    path=img[0],
+                    threshold=img[1],
+                    min_delay=img[2],
+                    max_delay=img[3],
+                    timeout=img[4],
+                    candidates=ImageItem.candidates_from_json(img[5]),
+                    optional=bool(img[6]),
+                    goto=img[7] or 0,
+                    timeout_goto=img[8] or 0
                 ) for img in images_data
             ]
 
@@ -302,9 +969,94 @@ class DatabaseManager:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM images WHERE task_id = ?', (task_id,))
+            cursor.execute('DELETE FROM schedules WHERE task_id = ?', (task_id,))
             cursor.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
             conn.commit()
 
+    def add_schedule(self, entry: ScheduleEntry):
+        """保存计划任务"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO schedules (task_id, mode, interval_minutes, daily_time, max_rounds,
+                                       time_limit, enabled, next_run, last_run, position)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (entry.task_id, entry.mode, entry.interval_minutes, entry.daily_time, entry.max_rounds,
+                  entry.time_limit, int(entry.enabled), entry.next_run, entry.last_run, entry.position))
+            conn.commit()
+            entry.id = cursor.lastrowid
+            return entry.id
+
+    def get_schedules(self):
+        """获取全部计划任务"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT task_id, mode, interval_minutes, daily_time, max_rounds, time_limit,
+                       enabled, next_run, last_run, position, id
+                FROM schedules ORDER BY position, id
+            ''')
+            return [
+                ScheduleEntry(
+                    task_id=row[0],
+                    mode=row[1],
+                    interval_minutes=row[2] or 0,
+                    daily_time=row[3] or '00:00',
+                    max_rounds=row[4] or 0,
+                    time_limit=row[5] or 0,
+                    enabled=bool(row[6]),
+                    next_run=row[7] or '',
+                    last_run=row[8] or '',
+                    position=row[9] or 0,
+                    id=row[10]
+                ) for row in cursor.fetchall()
+            ]
+
+    def update_schedule(self, entry: ScheduleEntry):
+        """更新计划任务的运行状态"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE schedules SET enabled = ?, next_run = ?, last_run = ? WHERE id = ?
+            ''', (int(entry.enabled), entry.next_run, entry.last_run, entry.id))
+            conn.commit()
+
+    def delete_schedule(self, schedule_id):
+        """删除计划任务"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM schedules WHERE id = ?', (schedule_id,))
+            conn.commit()
+
+    def get_setting(self, key, default=None):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
+            row = cursor.fetchone()
+            return row[0] if row else default
+
+    def set_setting(self, key, value):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, str(value)))
+            conn.commit()
+
+    def export_task(self, task_id, bundle_path, with_gray=False):
+        """导出任务为任务包"""
+        TaskBundle.write(self.load_task(task_id), bundle_path, with_gray)
+
+    def import_task(self, bundle_path):
+        """导入任务包：任务包复制到本地目录，模板直接从任务包读取"""
+        os.makedirs(BUNDLE_DIR, exist_ok=True)
+        target = os.path.join(BUNDLE_DIR, os.path.basename(bundle_path))
+        if os.path.abspath(target) != os.path.abspath(bundle_path):
+            if os.path.exists(target):
+                stem, ext = os.path.splitext(target)
+                target = f"{stem}_{datetime.now().strftime('%Y%m%d%H%M%S')}{ext}"
+            shutil.copyfile(bundle_path, target)
+        task = TaskBundle.open(target).to_task()
+        return self.save_task(task)
+
 
 # 添加新的日志窗口类
 class LogWindow(QDialog):
@@ -328,6 +1080,17 @@ class LogWindow(QDialog):
         image_group.setLayout(image_layout)
         splitter.addWidget(image_group)
 
+        # 性能指标显示区域
+        metrics_group = QGroupBox("性能指标")
+        metrics_layout = QFormLayout()
+        self.metric_labels = {}
+        for key, title in [('fps', '截图帧率:'), ('latency', '匹配延迟:'), ('cpu', 'CPU时间:'),
+                           ('time', '检测/等待:'), ('frames', '截图/复用:'), ('memory', '内存占用:')]:
+            self.metric_labels[key] = QLabel('-')
+            metrics_layout.addRow(title, self.metric_labels[key])
+        metrics_group.setLayout(metrics_layout)
+        splitter.addWidget(metrics_group)
+
         # 日志显示区域
         log_group = QGroupBox("处理日志")
         log_layout = QVBoxLayout()
@@ -346,6 +1109,25 @@ class LogWindow(QDialog):
             self.log_text.verticalScrollBar().maximum()
         )
 
+    def updateMetrics(self, metrics):
+        self.metric_labels['fps'].setText(f"{metrics['fps']:.1f} 帧/秒")
+        latency = metrics['latency_ms']
+        if latency:
+            self.metric_labels['latency'].setText(
+                f"p50 {latency['p50']:.1f}ms / p90 {latency['p90']:.1f}ms / p99 {latency['p99']:.1f}ms"
+            )
+        self.metric_labels['cpu'].setText(
+            f"本轮 {metrics['round_cpu']:.2f}秒 / 上轮 {metrics['last_round_cpu']:.2f}秒"
+        )
+        total = metrics['detect_time'] + metrics['sleep_time']
+        detect_ratio = metrics['detect_time'] / total * 100 if total else 0
+        self.metric_labels['time'].setText(
+            f"{metrics['detect_time']:.1f}秒 / {metrics['sleep_time']:.1f}秒 (检测占 {detect_ratio:.0f}%)"
+        )
+        self.metric_labels['frames'].setText(f"{metrics['captured']} / {metrics['reused']}")
+        memory = metrics['memory_mb']
+        self.metric_labels['memory'].setText(f"{memory:.0f} MB" if memory is not None else "未知")
+
     def updateImage(self, pixmap):
         self.current_image.setPixmap(
             pixmap.scaled(
@@ -364,6 +1146,13 @@ class ImageProcessor(QMainWindow):
         self.db = DatabaseManager()
         self.log_window = LogWindow(self)  # 创建日志窗口
 
+        # 计划任务
+        self.scheduler = TaskScheduler(self.db)
+        self.warm_start = None  # 预加载的下一个任务模板: (任务ID, 模板缓存)
+        self.preload_thread = None  # 正在预加载模板的线程
+        self.schedule_timer = QTimer(self)
+        self.schedule_timer.timeout.connect(self.checkSchedules)
+
         # 配置日志系统
         logging.basicConfig(
             level=logging.INFO,
@@ -375,6 +1164,10 @@ class ImageProcessor(QMainWindow):
 
         self.initUI()
 
+        # 上次退出时计划处于运行状态则自动恢复
+        if self.db.get_setting('scheduler_enabled') == '1':
+            self.startScheduler()
+
     def initUI(self):
         self.setWindowTitle('智能图像识别点击工具')
         self.setGeometry(100, 100, 1000, 800)
@@ -402,6 +1195,14 @@ class ImageProcessor(QMainWindow):
         clear_button.clicked.connect(self.clearImages)
         button_layout.addWidget(clear_button)
 
+        schedule_button = QPushButton('计划任务', self)
+        schedule_button.clicked.connect(self.showScheduleDialog)
+        button_layout.addWidget(schedule_button)
+
+        self.scheduler_button = QPushButton('启动计划', self)
+        self.scheduler_button.clicked.connect(self.toggleScheduler)
+        button_layout.addWidget(self.scheduler_button)
+
         layout.addLayout(button_layout)
 
         # 进度条
@@ -450,6 +1251,10 @@ class ImageProcessor(QMainWindow):
         task_list_button.clicked.connect(self.showTaskList)
         task_control_layout.addWidget(task_list_button)
 
+        import_task_button = QPushButton("导入任务包")
+        import_task_button.clicked.connect(self.importTask)
+        task_control_layout.addWidget(import_task_button)
+
         layout.insertLayout(1, task_control_layout)
         layout.insertWidget(2, self.task_description)
 
@@ -531,6 +1336,7 @@ class ImageProcessor(QMainWindow):
                     timeout=float(timeout_spin.value())
                 )
                 self.image_items.append(image_item)
+                self.addBranchControls(info_layout, image_item)
 
                 # 修改信号连接部分
                 index = len(self.image_items) - 1
@@ -543,6 +1349,79 @@ class ImageProcessor(QMainWindow):
             QMessageBox.warning(self, "错误", f"添加图像失败: {str(e)}")
             logging.error(f"添加图像失败: {str(e)}")
 
+    def addBranchControls(self, info_layout, img_item: ImageItem):
+        """添加分支步骤设置：可选步骤、跳转和候选模板"""
+        branch_layout = QHBoxLayout()
+
+        optional_check = QCheckBox("可选步骤")
+        optional_check.setChecked(img_item.optional)
+        optional_check.setToolTip("超时或下一步模板先出现时直接跳过")
+        optional_check.stateChanged.connect(
+            lambda state: setattr(img_item, 'optional', state == Qt.Checked)
+        )
+        branch_layout.addWidget(optional_check)
+
+        branch_layout.addWidget(QLabel("命中跳转:"))
+        goto_spin = QSpinBox()
+        goto_spin.setRange(0, 999)
+        goto_spin.setSpecialValueText("顺序")
+        goto_spin.setValue(img_item.goto)
+        goto_spin.valueChanged.connect(lambda value: setattr(img_item, 'goto', value))
+        branch_layout.addWidget(goto_spin)
+
+        branch_layout.addWidget(QLabel("超时跳转:"))
+        timeout_goto_spin = QSpinBox()
+        timeout_goto_spin.setRange(0, 999)
+        timeout_goto_spin.setSpecialValueText("顺序")
+        timeout_goto_spin.setValue(img_item.timeout_goto)
+        timeout_goto_spin.valueChanged.connect(lambda value: setattr(img_item, 'timeout_goto', value))
+        branch_layout.addWidget(timeout_goto_spin)
+
+        candidates_label = QLabel(f"候选模板: {len(img_item.candidates)}")
+        branch_layout.addWidget(candidates_label)
+
+        add_candidate_button = QPushButton("添加候选")
+        add_candidate_button.clicked.connect(
+            lambda checked: self.addCandidates(img_item, candidates_label)
+        )
+        branch_layout.addWidget(add_candidate_button)
+
+        clear_candidate_button = QPushButton("清空候选")
+        clear_candidate_button.clicked.connect(
+            lambda checked: self.clearCandidates(img_item, candidates_label)
+        )
+        branch_layout.addWidget(clear_candidate_button)
+
+        info_layout.addLayout(branch_layout)
+
+    def addCandidates(self, img_item: ImageItem, candidates_label: QLabel):
+        """为步骤添加候选模板，任一候选命中即完成该步骤"""
+        file_names, _ = QFileDialog.getOpenFileNames(
+            self,
+            "选择候选图像",
+            "",
+            "图像文件 (*.png *.jpg *.jpeg *.bmp)"
+        )
+        if not file_names:
+            return
+
+        goto, ok = QInputDialog.getInt(
+            self, "候选模板", "命中后跳转到步骤(0表示顺序执行):", 0, 0, 999
+        )
+        if not ok:
+            return
+
+        for file_name in file_names:
+            img_item.candidates.append(
+                StepCandidate(path=file_name, threshold=img_item.threshold, goto=goto)
+            )
+        candidates_label.setText(f"候选模板: {len(img_item.candidates)}")
+        logging.info(f"步骤 {os.path.basename(img_item.path)} 添加候选模板: {file_names}")
+
+    def clearCandidates(self, img_item: ImageItem, candidates_label: QLabel):
+        img_item.candidates.clear()
+        candidates_label.setText("候选模板: 0")
+
     def deleteImage(self, widget):
         index = self.findWidgetIndex(widget)
         if index >= 0:
@@ -571,20 +1450,215 @@ class ImageProcessor(QMainWindow):
             QMessageBox.warning(self, "警告", "处理已在进行中")
             return
 
+        self.startThread(self.image_items, self.loop_count_spin.value())
+
+    def startThread(self, images: List[ImageItem], loop_count, templates=None, time_limit=0):
+        """创建并启动处理线程"""
         self.log_window.log_text.clear()
         self.log_window.show()  # 显示日志窗口
 
-        self.process_thread = ImageProcessThread(
-            self.image_items,
-            self.loop_count_spin.value()
-        )
+        self.process_thread = ImageProcessThread(images, loop_count, templates, time_limit)
         self.process_thread.progress_signal.connect(self.updateProgress)
         self.process_thread.result_signal.connect(self.updateLog)
         self.process_thread.finished_signal.connect(self.processingFinished)
         self.process_thread.image_signal.connect(self.updateCurrentImage)
+        self.process_thread.metrics_signal.connect(self.log_window.updateMetrics)
+        self.process_thread.finished.connect(self.onThreadFinished)
         self.process_thread.start()
 
+    def onThreadFinished(self):
+        # 计划运行中时立即检查下一个任务，不留空闲间隔
+        if self.schedule_timer.isActive():
+            QTimer.singleShot(0, self.checkSchedules)
+
+    def toggleScheduler(self):
+        if self.schedule_timer.isActive():
+            self.stopScheduler()
+        else:
+            self.startScheduler()
+
+    def startScheduler(self):
+        """启动计划任务"""
+        self.schedule_timer.start(5000)
+        self.scheduler_button.setText('停止计划')
+        self.db.set_setting('scheduler_enabled', 1)
+        logging.info("计划任务已启动")
+        self.checkSchedules()
+
+    def stopScheduler(self):
+        """停止计划任务，正在运行的任务不受影响"""
+        self.schedule_timer.stop()
+        self.discardWarmStart()
+        self.scheduler_button.setText('启动计划')
+        self.db.set_setting('scheduler_enabled', 0)
+        self.updateLog("计划任务已停止")
+
+    def checkSchedules(self):
+        """空闲时运行到期的计划任务"""
+        if self.process_thread and self.process_thread.isRunning():
+            return
+
+        entry = self.scheduler.next_due()
+        if entry is None:
+            self.prepareWarmStart()
+            return
+
+        try:
+            task = self.db.load_task(entry.task_id)
+        except ValueError as e:
+            logging.error(f"计划任务加载失败: {str(e)}")
+            entry.enabled = False
+            self.db.update_schedule(entry)
+            return
+
+        # 使用预加载的模板
+        templates = None
+        if self.warm_start and self.warm_start[0] == entry.task_id:
+            templates = self.warm_start[1]
+        self.warm_start = None
+
+        self.scheduler.mark_started(entry)
+        self.startThread(task.images, entry.max_rounds or task.loop_count, templates, entry.time_limit * 60)
+        self.updateLog(f"计划任务开始: {task.name} ({SCHEDULE_MODES[entry.mode]})")
+        self.prepareWarmStart()
+
+    def prepareWarmStart(self):
+        """提前在后台加载下一个计划任务的模板"""
+        entry = self.scheduler.upcoming()
+        if entry is None or (self.warm_start and self.warm_start[0] == entry.task_id):
+            return
+        if self.preload_thread and self.preload_thread.isRunning():
+            return  # 上一次预加载完成后再检查
+        try:
+            task = self.db.load_task(entry.task_id)
+        except Exception as e:
+            logging.error(f"预加载计划任务失败: {str(e)}")
+            return
+        self.preload_thread = TemplatePreloadThread(entry.task_id, task.images)
+        self.preload_thread.loaded_signal.connect(self.onTemplatesPreloaded)
+        self.preload_thread.start()
+
+    def onTemplatesPreloaded(self, task_id, templates):
+        self.warm_start = (task_id, templates)
+
+    def discardWarmStart(self, task_id=None):
+        """丢弃预加载的模板并释放其任务包映射；指定task_id时只丢弃该任务的"""
+        if self.warm_start is None or (task_id is not None and self.warm_start[0] != task_id):
+            return
+        task_id = self.warm_start[0]
+        self.warm_start = None
+        try:
+            self.releaseTaskBundles(self.db.load_task(task_id))
+        except ValueError:
+            pass  # 任务已被删除
+
+    def releaseTaskBundles(self, task: Task):
+        """不再使用任务时释放它引用的任务包，正在运行的任务仍引用的映射会保持打开"""
+        for bundle_path in task_bundle_paths(task):
+            TaskBundle.release(bundle_path)
+
+    def showScheduleDialog(self):
+        """显示计划任务对话框"""
+        try:
+            tasks = self.db.get_all_tasks()
+            if not tasks:
+                QMessageBox.information(self, "提示", "暂无保存的任务")
+                return
+            task_names = {task_id: name for task_id, name, created_time in tasks}
+
+            dialog = QDialog(self)
+            dialog.setWindowTitle("计划任务")
+            dialog.setMinimumWidth(500)
+            layout = QVBoxLayout(dialog)
+
+            schedule_list = QListWidget()
+            layout.addWidget(schedule_list)
+
+            def refresh():
+                schedule_list.clear()
+                for entry in self.db.get_schedules():
+                    item = QListWidgetItem(
+                        f"{task_names.get(entry.task_id, entry.task_id)} | {SCHEDULE_MODES[entry.mode]} | "
+                        f"下次运行: {entry.next_run or '-'} | 上次运行: {entry.last_run or '-'} | "
+                        f"{'启用' if entry.enabled else '停用'}"
+                    )
+                    item.setData(Qt.UserRole, entry.id)
+                    schedule_list.addItem(item)
+
+            # 新计划设置
+            form = QFormLayout()
+            task_combo = QComboBox()
+            for task_id, name in task_names.items():
+                task_combo.addItem(name, task_id)
+            form.addRow("任务:", task_combo)
+
+            mode_combo = QComboBox()
+            for mode, label in SCHEDULE_MODES.items():
+                mode_combo.addItem(label, mode)
+            form.addRow("方式:", mode_combo)
+
+            interval_spin = QSpinBox()
+            interval_spin.setRange(0, 10080)
+            interval_spin.setSpecialValueText("结束后立即")
+            form.addRow("间隔(分钟):", interval_spin)
+
+            time_edit = QTimeEdit(QTime.currentTime())
+            time_edit.setDisplayFormat("HH:mm")
+            form.addRow("每天时间:", time_edit)
+
+            rounds_spin = QSpinBox()
+            rounds_spin.setRange(0, 999999)
+            rounds_spin.setSpecialValueText("任务设置")
+            form.addRow("轮次限制:", rounds_spin)
+
+            time_limit_spin = QSpinBox()
+            time_limit_spin.setRange(0, 1440)
+            time_limit_spin.setSpecialValueText("不限")
+            form.addRow("时间限制(分钟):", time_limit_spin)
+            layout.addLayout(form)
+
+            def add_schedule():
+                self.scheduler.add(ScheduleEntry(
+                    task_id=task_combo.currentData(),
+                    mode=mode_combo.currentData(),
+                    interval_minutes=interval_spin.value(),
+                    daily_time=time_edit.time().toString("HH:mm"),
+                    max_rounds=rounds_spin.value(),
+                    time_limit=time_limit_spin.value()
+                ))
+                refresh()
+
+            def delete_schedule():
+                if schedule_list.currentItem():
+                    self.db.delete_schedule(schedule_list.currentItem().data(Qt.UserRole))
+                    self.discardWarmStart()  # 下一个计划任务可能已经改变，之后重新预加载
+                    refresh()
+
+            button_layout = QHBoxLayout()
+            add_button = QPushButton("添加计划")
+            add_button.clicked.connect(add_schedule)
+            button_layout.addWidget(add_button)
+
+            delete_button = QPushButton("删除计划")
+            delete_button.clicked.connect(delete_schedule)
+            button_layout.addWidget(delete_button)
+
+            close_button = QPushButton("关闭")
+            close_button.clicked.connect(dialog.close)
+            button_layout.addWidget(close_button)
+            layout.addLayout(button_layout)
+
+            refresh()
+            dialog.exec_()
+
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"显示计划任务失败: {str(e)}")
+            logging.error(f"显示计划任务失败: {str(e)}")
+
     def stopProcessing(self):
+        # 手动停止时同时停止计划，避免立即开始下一个任务
+        if self.schedule_timer.isActive():
+            self.stopScheduler()
         if self.process_thread and self.process_thread.isRunning():
             self.process_thread.stop()
             self.process_thread.wait()
@@ -604,6 +1678,10 @@ class ImageProcessor(QMainWindow):
         if self.process_thread and self.process_thread.isRunning():
             self.process_thread.stop()
             self.process_thread.wait()
+        if self.preload_thread and self.preload_thread.isRunning():
+            self.preload_thread.wait()
+        self.warm_start = None
+        TaskBundle.close_all()
         event.accept()
 
     def updateCurrentImage(self, pixmap):
@@ -720,7 +1798,7 @@ class ImageProcessor(QMainWindow):
 
             # 图像预览
             label = QLabel()
-            pixmap = QPixmap(img_item.path)
+            pixmap = load_template_pixmap(img_item.path)
             label.setPixmap(pixmap.scaled(100, 100, Qt.KeepAspectRatio))
             item_layout.addWidget(label)
 
@@ -774,6 +1852,7 @@ class ImageProcessor(QMainWindow):
 
             self.image_layout.addWidget(item_widget)
             self.image_items.append(img_item)
+            self.addBranchControls(info_layout, img_item)
 
             # 修改信号连接部分
             index = len(self.image_items) - 1
@@ -822,6 +1901,11 @@ class ImageProcessor(QMainWindow):
             edit_button.clicked.connect(lambda: self.editTask(task_list))
             button_layout.addWidget(edit_button)
 
+            # 导出按钮
+            export_button = QPushButton("导出")
+            export_button.clicked.connect(lambda: self.exportTaskFromList(task_list))
+            button_layout.addWidget(export_button)
+
             # 删除按钮
             delete_button = QPushButton("删除")
             delete_button.clicked.connect(lambda: self.deleteTaskFromList(task_list))
@@ -911,7 +1995,10 @@ class ImageProcessor(QMainWindow):
             )
 
             if reply == QMessageBox.Yes:
+                task = self.db.load_task(task_id)
+                self.discardWarmStart(task_id)
                 self.db.delete_task(task_id)
+                self.releaseTaskBundles(task)
                 task_list.takeItem(task_list.currentRow())
                 QMessageBox.information(self, "成功", "任务已删除")
 
@@ -919,6 +2006,58 @@ class ImageProcessor(QMainWindow):
             QMessageBox.warning(self, "错误", f"删除任务失败: {str(e)}")
             logging.error(f"删除任务失败: {str(e)}")
 
+    def exportTaskFromList(self, task_list: QListWidget):
+        """导出选中的任务为任务包"""
+        if not task_list.currentItem():
+            QMessageBox.warning(self, "警告", "请先选择任务")
+            return
+
+        try:
+            task_id = task_list.currentItem().data(Qt.UserRole)
+            file_name, _ = QFileDialog.getSaveFileName(
+                self,
+                "导出任务包",
+                f"{task_list.currentItem().text()}.txsb",
+                "任务包 (*.txsb)"
+            )
+            if not file_name:
+                return
+
+            reply = QMessageBox.question(
+                self,
+                "导出选项",
+                "是否同时保存预计算的灰度模板？\n(导入后直接映射使用，匹配按灰度进行)",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No
+            )
+            self.db.export_task(task_id, file_name, with_gray=reply == QMessageBox.Yes)
+            QMessageBox.information(self, "成功", f"任务已导出: {file_name}")
+            logging.info(f"任务已导出，ID: {task_id}，文件: {file_name}")
+
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"导出任务失败: {str(e)}")
+            logging.error(f"导出任务失败: {str(e)}")
+
+    def importTask(self):
+        """导入任务包"""
+        try:
+            file_name, _ = QFileDialog.getOpenFileName(
+                self,
+                "导入任务包",
+                "",
+                "任务包 (*.txsb)"
+            )
+            if not file_name:
+                return
+
+            task_id = self.db.import_task(file_name)
+            QMessageBox.information(self, "成功", f"任务已导入，ID: {task_id}")
+            logging.info(f"任务包已导入，ID: {task_id}，文件: {file_name}")
+
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"导入任务失败: {str(e)}")
+            logging.error(f"导入任务失败: {str(e)}")
+
     def create_timeout_handler(self, index):
         return lambda value: self.updateTimeout(index, float(value))
 
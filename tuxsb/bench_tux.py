@@ -0,0 +1,363 @@
+"""ScreenTimeReader 识别耗时与准确率基准测试
+
+用法(在项目根目录下运行):
+    python -m tuxsb.bench_tux --rounds 50
+    python -m tuxsb.bench_tux --presets --rounds 10
+    python -m tuxsb.bench_tux --full --corpus 40 --report bench_report.json --compare old_report.json
+"""
+import argparse
+import difflib
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from tuxsb.time_tux import (ScreenTimeReader, PreprocessPipeline, PREPROCESS_PRESETS, GlyphDigitRecognizer,
+                            available_backends, binarize, create_ocr_backend)
+
+SAMPLE_DIR = os.path.dirname(os.path.abspath(__file__))
+TIME_SAMPLE = os.path.join(SAMPLE_DIR, 'original_time.png')
+
+# 示例图片: (文件名, 正确文本, 语言, 白名单, psm)
+SAMPLES = [
+    ('original_time.png', '01:45', 'eng', '0123456789:', 7),
+    ('original_screenshot.png', '123', 'eng', '0123456789', 7),
+    ('original_chinese.png', "self.custom_config = r'--oem 3 --psm 6 -l chi_sim'", 'eng', '', 7),
+    ('original_number.png', '如果以上方法都不能解决问题，可能需要进一步分析具体的错误信息，'
+                            '或者提供更多的上下文信息，以便更好地定位问题。', 'chi_sim', '', 6),
+]
+
+
+def load_sample(file_name):
+    """读取示例图片，示例是放大3倍后保存的截图，缩小回原始截图大小"""
+    image = Image.open(os.path.join(SAMPLE_DIR, file_name)).convert('RGB')
+    array = cv2.resize(np.array(image), (image.width // 3, image.height // 3),
+                       interpolation=cv2.INTER_AREA)
+    return Image.fromarray(array)
+
+
+def normalize_text(text):
+    return ''.join(text.split())
+
+
+def char_accuracy(expected, actual):
+    """字符级相似度"""
+    return difflib.SequenceMatcher(None, normalize_text(expected), normalize_text(actual)).ratio()
+
+
+def summarize(latencies):
+    """耗时统计(毫秒)"""
+    values = np.array(latencies) * 1000
+    return {
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p99': float(np.percentile(values, 99)),
+        'min': float(values.min()),
+    }
+
+
+def bench_backends(rounds):
+    """在时间示例图片上测量每个OCR后端的单次识别耗时"""
+    image = load_sample(os.path.basename(TIME_SAMPLE))
+    results = {}
+
+    for name in available_backends():
+        backend = create_ocr_backend(name)
+        reader = ScreenTimeReader(backend)
+        processed = reader.preprocess_image(image)
+        try:
+            # 第一次调用包含引擎初始化时间，单独记录
+            start = time.perf_counter()
+            text = backend.recognize(processed, psm=reader.psm, whitelist=reader.whitelist).strip()
+            first_call = time.perf_counter() - start
+
+            latencies = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                backend.recognize(processed, psm=reader.psm, whitelist=reader.whitelist)
+                latencies.append(time.perf_counter() - start)
+        finally:
+            backend.close()
+
+        results[name] = dict(summarize(latencies), first_call=first_call * 1000, text=text)
+    return results
+
+
+def bench_presets(rounds, backend_name='auto'):
+    """测量每个预处理预设在各示例图片上的预处理耗时、识别耗时和准确率"""
+    backend = create_ocr_backend(backend_name)
+    results = {}
+    try:
+        for preset in PREPROCESS_PRESETS:
+            pipeline = PreprocessPipeline.from_preset(preset)
+            rows = []
+            for file_name, expected, lang, whitelist, psm in SAMPLES:
+                image = load_sample(file_name)
+                preprocess_times = []
+                ocr_times = []
+                text = ''
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    processed = pipeline.run(image)
+                    preprocess_times.append(time.perf_counter() - start)
+
+                    start = time.perf_counter()
+                    text = backend.recognize(processed, lang=lang, psm=psm, whitelist=whitelist).strip()
+                    ocr_times.append(time.perf_counter() - start)
+
+                rows.append({
+                    'sample': file_name,
+                    'text': text,
+                    'exact': normalize_text(text) == normalize_text(expected),
+                    'accuracy': char_accuracy(expected, text),
+                    'preprocess': summarize(preprocess_times),
+                    'ocr': summarize(ocr_times),
+                })
+            results[preset] = rows
+    finally:
+        backend.close()
+    return results
+
+
+# 合成图片使用的字体，不存在的会被跳过
+FONT_CANDIDATES = [
+    r'C:\Windows\Fonts\arial.ttf',
+    r'C:\Windows\Fonts\consola.ttf',
+    r'C:\Windows\Fonts\msyh.ttc',
+    r'C:\Windows\Fonts\simsun.ttc',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf',
+]
+FONT_SIZES = [12, 16, 24, 32]
+NOISE_LEVELS = [0, 8, 20]
+# (前景色, 背景色)
+COLOR_PAIRS = [
+    ((255, 255, 255), (40, 42, 46)),
+    ((0, 0, 0), (255, 255, 255)),
+    ((80, 220, 80), (0, 0, 0)),
+    ((150, 150, 150), (90, 90, 90)),
+]
+GLYPH_TRAINING_TEXT = '0123456789:'
+
+
+def available_fonts():
+    """可用字体: (名称, 路径)，没有找到字体文件时使用PIL自带字体"""
+    fonts = [(os.path.splitext(os.path.basename(path))[0], path)
+             for path in FONT_CANDIDATES if os.path.exists(path)]
+    return fonts or [('default', None)]
+
+
+def load_font(path, size):
+    if path is None:
+        try:
+            return ImageFont.load_default(size=size)
+        except TypeError:
+            return ImageFont.load_default()
+    return ImageFont.truetype(path, size)
+
+
+def render_text(text, font_path, size, color_pair=COLOR_PAIRS[0], noise=0, rng=None):
+    """按指定字体、大小、颜色渲染文字并加噪声，模拟原始截图"""
+    font = load_font(font_path, size)
+    left, top, right, bottom = font.getbbox(text)
+    padding = max(4, size // 3)
+    image = Image.new('RGB', (right - left + padding * 2, bottom - top + padding * 2), color_pair[1])
+    ImageDraw.Draw(image).text((padding - left, padding - top), text, font=font, fill=color_pair[0])
+    if noise:
+        rng = rng or np.random.default_rng()
+        array = np.array(image).astype(np.int16) + rng.normal(0, noise, (image.height, image.width, 3))
+        image = Image.fromarray(np.clip(array, 0, 255).astype(np.uint8))
+    return image
+
+
+def generate_corpus(count, seed=0):
+    """生成合成时钟和数字图片，再加上tuxsb目录下的真实示例"""
+    rng = random.Random(seed)
+    noise_rng = np.random.default_rng(seed)
+    fonts = available_fonts()
+    corpus = []
+
+    for kind in ('clock', 'number'):
+        for index in range(count):
+            if kind == 'clock':
+                if rng.random() < 0.5:
+                    expected = f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}"
+                else:
+                    expected = f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}"
+                whitelist = '0123456789:'
+            else:
+                expected = str(rng.randint(0, 10 ** rng.randint(1, 6)))
+                whitelist = '0123456789'
+
+            font_name, font_path = fonts[index % len(fonts)]
+            size = rng.choice(FONT_SIZES)
+            noise = rng.choice(NOISE_LEVELS)
+            color_index = rng.randrange(len(COLOR_PAIRS))
+            corpus.append({
+                'name': f'{kind}_{index}',
+                'image': render_text(expected, font_path, size, COLOR_PAIRS[color_index], noise, noise_rng),
+                'expected': expected,
+                'lang': 'eng',
+                'whitelist': whitelist,
+                'psm': 7,
+                'font': font_name,
+                'tags': {'kind': kind, 'font': font_name, 'size': size, 'noise': noise, 'color': color_index},
+            })
+
+    for file_name, expected, lang, whitelist, psm in SAMPLES:
+        corpus.append({
+            'name': file_name,
+            'image': load_sample(file_name),
+            'expected': expected,
+            'lang': lang,
+            'whitelist': whitelist,
+            'psm': psm,
+            'font': None,
+            'tags': {'kind': 'sample'},
+        })
+    return corpus
+
+
+def train_glyphs(directory):
+    """为每种字体渲染0-9和冒号，训练字形识别模板"""
+    recognizers = {}
+    for font_name, font_path in available_fonts():
+        recognizer = GlyphDigitRecognizer(font_name, glyph_dir=directory)
+        recognizer.learn(binarize(render_text(GLYPH_TRAINING_TEXT, font_path, 32)), GLYPH_TRAINING_TEXT)
+        recognizers[font_name] = recognizer
+    return recognizers
+
+
+def run_combo(corpus, recognize, rounds):
+    """对语料中每张图片重复识别，统计准确率、延迟和吞吐量"""
+    latencies = []
+    exact = 0
+    accuracy = 0.0
+    failures = []
+    for sample in corpus:
+        text = ''
+        for _ in range(rounds):
+            start = time.perf_counter()
+            text = recognize(sample)
+            latencies.append(time.perf_counter() - start)
+        if normalize_text(text) == normalize_text(sample['expected']):
+            exact += 1
+        else:
+            failures.append({'sample': sample['name'], 'expected': sample['expected'], 'text': text})
+        accuracy += char_accuracy(sample['expected'], text)
+
+    stats = summarize(latencies)
+    return {
+        'exact': exact / len(corpus),
+        'char_accuracy': accuracy / len(corpus),
+        'latency_ms': stats,
+        'throughput': 1000 / stats['mean'] if stats['mean'] else 0.0,
+        'failures': failures,
+    }
+
+
+def bench_full(count, rounds, seed, glyph_dir):
+    """在合成语料和真实示例上测试所有预处理预设与OCR后端组合"""
+    corpus = generate_corpus(count, seed)
+    results = {}
+
+    for backend_name in available_backends():
+        backend = create_ocr_backend(backend_name)
+        try:
+            for preset in PREPROCESS_PRESETS:
+                pipeline = PreprocessPipeline.from_preset(preset)
+
+                def recognize(sample, pipeline=pipeline, backend=backend):
+                    processed = pipeline.run(sample['image'])
+                    return backend.recognize(processed, lang=sample['lang'], psm=sample['psm'],
+                                             whitelist=sample['whitelist']).strip()
+
+                results[f'{backend_name}+{preset}'] = run_combo(corpus, recognize, rounds)
+        finally:
+            backend.close()
+
+    # 字形识别只适用于数字，不需要预处理和Tesseract
+    glyphs = train_glyphs(glyph_dir)
+    digit_corpus = [sample for sample in corpus if sample['font'] in glyphs]
+
+    def recognize_glyphs(sample):
+        return glyphs[sample['font']].recognize(binarize(sample['image']))[0]
+
+    if digit_corpus:
+        results['glyph'] = run_combo(digit_corpus, recognize_glyphs, rounds)
+
+    return {
+        'created_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'corpus': {'count': count, 'seed': seed, 'size': len(corpus), 'rounds': rounds,
+                   'fonts': [name for name, _ in available_fonts()]},
+        'results': results,
+    }
+
+
+def print_report(report, baseline=None):
+    """打印报告，提供基准报告时显示与基准的差异"""
+    print(f"语料: {report['corpus']['size']} 张图片，字体: {', '.join(report['corpus']['fonts'])}")
+    print(f"{'组合':24s} {'完全正确':>8s} {'字符准确率':>10s} {'p50(ms)':>9s} {'p99(ms)':>9s} {'吞吐(次/秒)':>11s}")
+    for combo, result in report['results'].items():
+        line = (f"{combo:24s} {result['exact']:8.1%} {result['char_accuracy']:10.1%} "
+                f"{result['latency_ms']['p50']:9.2f} {result['latency_ms']['p99']:9.2f} "
+                f"{result['throughput']:11.1f}")
+        old = (baseline or {}).get('results', {}).get(combo)
+        if old:
+            line += (f"   对比基准: 正确率 {result['exact'] - old['exact']:+.1%}  "
+                     f"p50 {result['latency_ms']['p50'] - old['latency_ms']['p50']:+.2f}ms")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ScreenTimeReader 识别耗时与准确率基准测试')
+    parser.add_argument('--rounds', type=int, default=50, help='每项测试的重复次数')
+    parser.add_argument('--presets', action='store_true', help='测试各预处理预设的耗时和准确率')
+    parser.add_argument('--backend', default='auto', help='测试预设时使用的OCR后端')
+    parser.add_argument('--full', action='store_true', help='在合成语料上测试所有预设与后端组合')
+    parser.add_argument('--corpus', type=int, default=40, help='每类合成图片的数量')
+    parser.add_argument('--seed', type=int, default=0, help='合成语料的随机种子，相同种子生成相同语料')
+    parser.add_argument('--report', default='bench_report.json', help='报告文件路径')
+    parser.add_argument('--compare', help='用于对比的旧报告文件')
+    parser.add_argument('--glyph-dir', help='字形训练模板的保存目录，默认使用临时目录')
+    args = parser.parse_args()
+
+    if args.full:
+        report = bench_full(args.corpus, args.rounds, args.seed, args.glyph_dir or tempfile.mkdtemp())
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        baseline = None
+        if args.compare:
+            with open(args.compare, encoding='utf-8') as f:
+                baseline = json.load(f)
+        print_report(report, baseline)
+        print(f"\n报告已保存: {args.report}")
+        return
+
+    if args.presets:
+        for preset, rows in bench_presets(args.rounds, args.backend).items():
+            print(f"\n预设 {preset}:")
+            for row in rows:
+                print(f"  {row['sample']:26s} 预处理 p50 {row['preprocess']['p50']:7.2f}ms  "
+                      f"识别 p50 {row['ocr']['p50']:7.1f}ms  准确率 {row['accuracy']:6.1%}  "
+                      f"{'正确' if row['exact'] else '错误'}  结果: {row['text']!r}")
+        return
+
+    print(f"示例图片: {TIME_SAMPLE}")
+    for name, stats in bench_backends(args.rounds).items():
+        print(f"{name:12s} 首次 {stats['first_call']:8.1f}ms  平均 {stats['mean']:7.1f}ms  "
+              f"p50 {stats['p50']:7.1f}ms  p99 {stats['p99']:7.1f}ms  结果: {stats['text']!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""语音控制回放测试：把录好的WAV文件经虚拟麦克风送入 监听→识别→执行 流程，统计各阶段耗时和命令准确率
+
+标注文件(默认为录音目录下的 labels.json)格式:
+    {"open_google.wav": {"intent": "open_browser", "text": "打开谷歌"}, ...}
+intent为期望执行的命令意图，没有命令的录音填null；text只在 --backend wav 时作为替身后端的识别结果。
+
+用法(在项目根目录下运行):
+    python -m tuxsb.replay_yuyin --dir recordings --backend wav
+    python -m tuxsb.replay_yuyin --dir recordings --backend keyword --realtime --report replay_report.json
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import speech_recognition as sr
+
+from tuxsb.yuyinzhiling import VoiceController, WavFileBackend, SAMPLE_RATE
+
+
+class VirtualMicrophone:
+    """虚拟麦克风：接口与sr.Microphone一致，播放排队的WAV文件，空闲时输出静音"""
+    SAMPLE_RATE = SAMPLE_RATE
+    SAMPLE_WIDTH = 2
+
+    def __init__(self, realtime=False):
+        self.realtime = realtime  # False时录音部分不等待，静音部分仍按实际时间输出
+        self.stream = self
+        self.lock = threading.Lock()
+        self.clips = deque()
+        self.buffer = b''
+        self.position = 0
+        self.finished_at = None  # 最近一个文件播放完的时间
+        self.idle = threading.Event()
+        self.idle.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    @staticmethod
+    def load(path):
+        with sr.AudioFile(path) as source:
+            audio = sr.Recognizer().record(source)
+        return audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2)
+
+    def play(self, path):
+        data = self.load(path)
+        with self.lock:
+            self.clips.append(data)
+            self.idle.clear()
+        return len(data) / 2 / SAMPLE_RATE
+
+    def read(self, size):
+        """读取size个采样，和PyAudio的stream.read一样阻塞到数据就绪"""
+        want = size * self.SAMPLE_WIDTH
+        with self.lock:
+            if self.position >= len(self.buffer) and self.clips:
+                self.buffer = self.clips.popleft()
+                self.position = 0
+            chunk = self.buffer[self.position:self.position + want]
+            self.position += len(chunk)
+            if chunk and self.position >= len(self.buffer):
+                self.finished_at = time.perf_counter()
+                if not self.clips:
+                    self.idle.set()
+        if self.realtime or not chunk:
+            time.sleep(size / SAMPLE_RATE)
+        return chunk + b'\x00' * (want - len(chunk))
+
+
+def load_labels(directory, labels_file=None):
+    """读取标注，返回 [(路径, 期望意图, 文本)]"""
+    labels_file = labels_file or os.path.join(directory, 'labels.json')
+    with open(labels_file, encoding='utf-8') as f:
+        labels = json.load(f)
+    samples = []
+    for name, label in sorted(labels.items()):
+        if not isinstance(label, dict):
+            label = {'intent': label}
+        samples.append((os.path.join(directory, name), label.get('intent'), label.get('text', '')))
+    return samples
+
+
+def summarize(latencies):
+    """耗时统计(毫秒)"""
+    if not latencies:
+        return None
+    values = np.array(latencies) * 1000
+    return {
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'max': float(values.max()),
+    }
+
+
+def replay(controller, microphone, samples, wait=5.0, execute=False):
+    """逐个播放录音并等待结果，返回每条录音的记录"""
+    records = []
+    for path, expected, _ in samples:
+        duration = microphone.play(path)
+        microphone.idle.wait()
+        audio_end = microphone.finished_at
+
+        events = []
+        deadline = time.perf_counter() + wait
+        while time.perf_counter() < deadline:
+            try:
+                events.append(controller.commands.get(timeout=0.05))
+            except queue.Empty:
+                # 切分和识别都已空闲且结果都已取出时，这条录音处理完毕，之后的结果不会串到下一条
+                if controller.idle() and controller.commands.empty():
+                    break
+
+        record = {'file': os.path.basename(path), 'expected': expected, 'duration': duration,
+                  'texts': [event.text for event in events], 'intent': None}
+        if events:
+            event = events[0]
+            start = time.perf_counter()
+            intent, phrase = controller.registry.match(event.text)
+            matched_at = time.perf_counter()
+            if intent is not None and execute:
+                intent.action(event.text)
+            done_at = time.perf_counter()
+            record.update({
+                'intent': intent.name if intent else None,
+                'phrase': phrase,
+                'segment': event.captured_at - audio_end,  # 录音结束到切分出整句(等待静音)
+                'queue': event.latency - event.recognize_time,
+                'recognize': event.recognize_time,
+                'match': matched_at - start,
+                'execute': done_at - matched_at,
+                # 回放线程的等待时间不计入
+                'total': event.captured_at - audio_end + event.latency + (done_at - start),
+            })
+        record['correct'] = record['intent'] == expected
+        records.append(record)
+        print(f"{record['file']:28s} 期望 {str(expected):16s} 结果 {str(record['intent']):16s} "
+              f"{'正确' if record['correct'] else '错误'}  识别文本: {record['texts']}")
+    return records
+
+
+def build_report(records, backend_name):
+    stages = ['segment', 'queue', 'recognize', 'match', 'execute', 'total']
+    detected = [record for record in records if 'total' in record]
+    return {
+        'backend': backend_name,
+        'samples': len(records),
+        'accuracy': sum(record['correct'] for record in records) / len(records) if records else 0.0,
+        'detected': len(detected),
+        'latency_ms': {stage: summarize([record[stage] for record in detected]) for stage in stages},
+        'records': records,
+    }
+
+
+def print_report(report):
+    print(f"\n后端: {report['backend']}  录音: {report['samples']} 条  "
+          f"有识别结果: {report['detected']} 条  准确率: {report['accuracy']:.1%}")
+    names = {'segment': '切分(等待静音)', 'queue': '排队', 'recognize': '识别', 'match': '匹配',
+             'execute': '执行', 'total': '录音结束到执行'}
+    for stage, stats in report['latency_ms'].items():
+        if stats:
+            print(f"  {names[stage]:14s} 平均 {stats['mean']:8.1f}ms  p50 {stats['p50']:8.1f}ms  "
+                  f"p90 {stats['p90']:8.1f}ms  最大 {stats['max']:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='语音控制回放测试')
+    parser.add_argument('--dir', required=True, help='录音目录')
+    parser.add_argument('--labels', help='标注文件，默认为录音目录下的labels.json')
+    parser.add_argument('--backend', default='auto', help='识别后端: auto/google/vosk/keyword/wav')
+    parser.add_argument('--realtime', action='store_true', help='按实际时长播放录音')
+    parser.add_argument('--execute', action='store_true', help='真正执行识别出的命令')
+    parser.add_argument('--wait', type=float, default=5.0, help='每条录音播放完后最多等待识别完成的秒数')
+    parser.add_argument('--calibrate', type=float, default=0.3, help='开始时校准环境噪音的秒数')
+    parser.add_argument('--report', help='保存JSON报告的路径')
+    args = parser.parse_args()
+
+    samples = load_labels(args.dir, args.labels)
+    if args.backend == 'wav':
+        backend = WavFileBackend({path: text for path, _, text in samples if text})
+    else:
+        backend = args.backend
+    controller = VoiceController(backend=backend)
+
+    microphone = VirtualMicrophone(realtime=args.realtime)
+    controller.start_listening(calibrate_seconds=args.calibrate, microphone=microphone)
+    controller.ready.wait()
+    try:
+        records = replay(controller, microphone, samples, wait=args.wait, execute=args.execute)
+    finally:
+        controller.stop_listening()
+
+    report = build_report(records, controller.backend.name)
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n报告已保存: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
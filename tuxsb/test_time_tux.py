@@ -0,0 +1,172 @@
+"""time_tux 的单元测试：用cv2绘制的时钟画面代替屏幕截图
+
+运行(在项目根目录下):
+    python -m pytest tuxsb/test_time_tux.py -q
+"""
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from tuxsb import time_tux
+from tuxsb.time_tux import (ClockTracker, GlyphDigitRecognizer, MultiRegionReader, OcrBackend, OcrRegion,
+                            RegionChangeDetector, RegionRegistry, ScreenTimeReader)
+
+
+def render_clock(text, size=(300, 60), scale=0.5):
+    """在白底区域左上角绘制时间文字，区域比文字大很多"""
+    width, height = size
+    canvas = np.full((height, width, 3), 255, np.uint8)
+    cv2.putText(canvas, text, (6, 20), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), 1, cv2.LINE_AA)
+    return Image.fromarray(canvas)
+
+
+def clock_text(seconds):
+    return f"{seconds // 3600 % 24:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def test_change_detector_sees_every_tick_in_large_region():
+    """区域留有大量空白时，最后一位数字的每次变化都要检测到"""
+    for size in [(300, 60), (200, 40)]:
+        detector = RegionChangeDetector()
+        start = 10 * 3600
+        assert detector.changed(render_clock(clock_text(start), size))
+        missed = [clock_text(second) for second in range(start + 1, start + 91)
+                  if not detector.changed(render_clock(clock_text(second), size))]
+        assert missed == [], f"区域 {size} 漏检: {missed}"
+
+
+def test_change_detector_ignores_identical_frames():
+    detector = RegionChangeDetector()
+    frame = render_clock('10:00:00')
+    assert detector.changed(frame)
+    assert not detector.changed(frame)
+    assert not detector.changed(render_clock('10:00:00'))
+
+
+class ScriptedOcr(OcrBackend):
+    """按脚本返回识别结果的OCR后端"""
+    name = 'scripted'
+
+    def __init__(self):
+        self.text = ''
+
+    def recognize(self, image, lang='eng', psm=7, whitelist=''):
+        return self.text
+
+
+class FakeScreenReader(ScreenTimeReader):
+    """截图返回预先设置的画面"""
+
+    def __init__(self, glyph_dir):
+        super().__init__(backend=ScriptedOcr(), preset='fast')
+        self.glyphs = GlyphDigitRecognizer('test', glyph_dir=str(glyph_dir))
+        self.frame = None
+
+    def grab_region(self, x, y, width, height):
+        return self.frame
+
+
+def make_tracker(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time_tux.time, 'monotonic', lambda: now[0])
+    reader = FakeScreenReader(tmp_path)
+    tracker = ClockTracker(reader, 0, 0, 300, 60)
+
+    def show(text, ocr_text=None, elapsed=1.0):
+        """时钟显示text，OCR读成ocr_text(默认读对)，经过elapsed秒后读取一次"""
+        now[0] += elapsed
+        reader.frame = render_clock(text)
+        reader.ocr.text = text if ocr_text is None else ocr_text
+        return tracker.read()
+
+    return tracker, show
+
+
+def test_tracker_confirms_clock_jump_while_ticking(tmp_path, monkeypatch):
+    """时钟被调整后每秒都在走，读数每次都不同，也要在confirm次读取内确认跳变"""
+    tracker, show = make_tracker(tmp_path, monkeypatch)
+    for second in range(10 * 3600, 10 * 3600 + 5):
+        assert show(clock_text(second)) == clock_text(second)
+
+    results = [show(clock_text(second)) for second in range(15 * 3600 + 30 * 60, 15 * 3600 + 30 * 60 + 5)]
+    assert results[0] == clock_text(10 * 3600 + 4)  # 第一次跳变先当作误读
+    assert results[tracker.confirm - 1:] == [clock_text(15 * 3600 + 30 * 60 + i)
+                                             for i in range(tracker.confirm - 1, 5)]
+    assert tracker.stats['resynced'] == 1
+
+
+def test_tracker_confirms_jump_of_minute_clock(tmp_path, monkeypatch):
+    """只显示到分钟的时钟跳变后画面不再变化，也要继续识别直到确认"""
+    tracker, show = make_tracker(tmp_path, monkeypatch)
+    assert show('10:00') == '10:00'
+    assert show('15:30') == '10:00'
+    assert show('15:30') == '15:30'
+    assert tracker.stats['resynced'] == 1
+
+
+def test_tracker_rejects_single_glitch(tmp_path, monkeypatch):
+    """偶尔一次误读不改变读数"""
+    tracker, show = make_tracker(tmp_path, monkeypatch)
+    tracker.reader.glyphs.min_confidence = 2.0  # 只用OCR识别
+    for second in range(10 * 3600, 10 * 3600 + 3):
+        show(clock_text(second))
+    assert show(clock_text(10 * 3600 + 3), ocr_text='18:08:03') == clock_text(10 * 3600 + 2)
+    assert show(clock_text(10 * 3600 + 4)) == clock_text(10 * 3600 + 4)
+    assert tracker.stats['resynced'] == 0
+    assert '8' not in tracker.reader.glyphs.chars  # 被拒绝的误读不学习字形
+
+
+def test_tracker_learns_only_confirmed_glyphs(tmp_path, monkeypatch):
+    """没有预测可以对照的第一次读数不学习，之后符合预测的读数才学习"""
+    tracker, show = make_tracker(tmp_path, monkeypatch)
+    tracker.reader.glyphs.min_confidence = 2.0
+    show('10:00:00')
+    assert tracker.reader.glyphs.chars == []
+    show('10:00:01')
+    assert set(tracker.reader.glyphs.chars) == set('10:')
+
+    tracker.reader.glyphs.reset()
+    assert tracker.reader.glyphs.chars == []
+    assert not (tmp_path / 'test.npz').exists()
+
+
+def test_reader_does_not_learn_unconfirmed_readings(tmp_path):
+    """不经ClockTracker确认的读数即使格式有效也可能是误读，不能学习字形"""
+    reader = FakeScreenReader(tmp_path)
+    reader.frame = render_clock('10:00:03')
+    reader.ocr.text = '18:08:03'
+    assert reader.read_time_from_region(0, 0, 300, 60) == '18:08:03'
+    assert reader.glyphs.chars == []
+    assert not (tmp_path / 'test.npz').exists()
+
+
+class BarrierOcr(OcrBackend):
+    """所有区域同时在识别时才返回结果，串行识别时等待超时"""
+    name = 'barrier'
+
+    def __init__(self, parties):
+        self.barrier = threading.Barrier(parties, timeout=2)
+
+    def recognize(self, image, lang='eng', psm=7, whitelist=''):
+        self.barrier.wait()
+        return 'ok'
+
+
+def test_multi_region_reader_runs_regions_added_later_concurrently(monkeypatch):
+    """读取器创建后登记的区域也要并发识别"""
+    registry = RegionRegistry()
+    registry.add(OcrRegion('r0', 0, 0, 300, 60))
+    reader = MultiRegionReader(registry, backend=BarrierOcr(4))
+    for i in range(1, 4):
+        registry.add(OcrRegion(f'r{i}', 0, 60 * i, 300, 60))
+
+    screen = np.full((240, 300, 3), 255, np.uint8)
+    for i in range(4):
+        cv2.putText(screen, f'1{i}:00:00', (6, 60 * i + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+    monkeypatch.setattr(time_tux.pyautogui, 'screenshot', lambda region: Image.fromarray(screen), raising=False)
+    try:
+        assert reader.read_all().values == {f'r{i}': 'ok' for i in range(4)}
+    finally:
+        reader.pool.shutdown(wait=True)
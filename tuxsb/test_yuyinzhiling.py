@@ -0,0 +1,103 @@
+"""yuyinzhiling 的单元测试：命令匹配和识别线程，不需要麦克风和识别模型
+
+运行(在项目根目录下):
+    python -m pytest tuxsb/test_yuyinzhiling.py -q
+"""
+import json
+import threading
+
+import speech_recognition as sr
+
+from tuxsb import yuyinzhiling
+from tuxsb.yuyinzhiling import (CommandRegistry, KeywordSpotter, OPEN_COMMANDS, RecognizerBackend, SAMPLE_RATE,
+                                VoiceController)
+
+
+def make_registry():
+    registry = CommandRegistry()
+    registry.register('open_browser', OPEN_COMMANDS, lambda command: None, '打开浏览器')
+    return registry
+
+
+def intent_name(registry, command):
+    intent, _ = registry.match(command)
+    return intent.name if intent else None
+
+
+def test_registry_matches_exact_and_close_phrases():
+    registry = make_registry()
+    assert intent_name(registry, '请帮我打开浏览器') == 'open_browser'
+    assert intent_name(registry, '打开 Chrome') == 'open_browser'
+    assert intent_name(registry, '打开一下浏览器') == 'open_browser'
+    assert intent_name(registry, '打开谷哥') == 'open_browser'
+
+
+def test_registry_rejects_opposite_verbs():
+    """动词相反的说法和命令短语很相似，也不能执行该命令"""
+    registry = make_registry()
+    for command in ['关闭浏览器', '关掉浏览器', '停止浏览器', '关闭谷歌', '关闭chrome', '退出浏览器']:
+        assert intent_name(registry, command) is None, command
+
+
+def test_registry_fuzzy_match_needs_common_keyword():
+    registry = make_registry()
+    assert intent_name(registry, '') is None
+    assert intent_name(registry, '今天天气') is None
+    assert intent_name(registry, '开打') is None
+
+
+class FakeVoskModel:
+    """只认识固定词表的vosk模型替身"""
+    words = {'打开', '谷歌', '浏览器', '启动', 'chrome'}
+
+    def __init__(self, model_path):
+        pass
+
+    def find_word(self, word):
+        return 1 if word in self.words else -1
+
+
+class FakeVosk:
+    Model = FakeVoskModel
+
+
+def test_keyword_grammar_skips_only_unknown_phrases(monkeypatch):
+    """有短语含词表外的词时只去掉这个短语，其余短语仍按语法识别"""
+    monkeypatch.setattr(yuyinzhiling, 'vosk', FakeVosk)
+    spotter = KeywordSpotter(OPEN_COMMANDS + ['打开网易云'])
+    assert spotter.name == 'keyword'
+    assert spotter.unknown_phrases == ['打开网易云']
+    assert json.loads(spotter.grammar) == ['打开 谷歌', '打开 浏览器', '打开 chrome', '启动 浏览器', '[unk]']
+
+    spotter = KeywordSpotter(['打开网易云'])
+    assert spotter.grammar is None and spotter.name == 'vosk'
+
+
+class FlakyBackend(RecognizerBackend):
+    """第一次识别时抛出异常，之后返回音频内容对应的文本"""
+    name = 'flaky'
+
+    def __init__(self):
+        self.calls = 0
+
+    def recognize(self, audio):
+        self.calls += 1
+        if self.calls == 1:
+            raise TimeoutError('socket timeout')
+        return audio.get_raw_data().decode('utf-8')
+
+
+def test_recognize_loop_survives_backend_error():
+    """后端抛出异常后识别线程继续工作，后面的话仍能识别"""
+    controller = VoiceController(backend=FlakyBackend())
+    controller.listening = True
+    thread = threading.Thread(target=controller._recognize_loop, daemon=True)
+    thread.start()
+    controller.threads = [thread]
+    for text in ['第一句', '打开浏览器']:
+        controller.phrases.put((sr.AudioData(text.encode('utf-8'), SAMPLE_RATE, 2), 0.0))
+
+    assert controller.commands.get(timeout=2).text == '打开浏览器'
+    assert thread.is_alive()
+    assert controller.commands.empty()
+    controller.stop_listening()
@@ -4,54 +4,453 @@ from PIL import Image
 import time
 import cv2
 import numpy as np
+import os
 import re
+import argparse
+import threading
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+try:
+    import tesserocr  # 可选：进程内常驻的Tesseract引擎
+except ImportError:
+    tesserocr = None
+
+# Tesseract安装路径
+TESSERACT_CMD = r'D:\Program Files\Tesseract-OCR\tesseract.exe'
+TESSDATA_DIR = os.path.join(os.path.dirname(TESSERACT_CMD), 'tessdata')
+
+
+class OcrBackend:
+    """OCR后端接口"""
+    name = 'base'
+
+    def recognize(self, image, lang='eng', psm=7, whitelist=''):
+        """识别PIL图像中的文字"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PytesseractBackend(OcrBackend):
+    """pytesseract后端：每次识别启动一个tesseract进程，通过临时文件传图"""
+    name = 'pytesseract'
+
+    def __init__(self, tesseract_cmd=TESSERACT_CMD):
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    def recognize(self, image, lang='eng', psm=7, whitelist=''):
+        config = f'--oem 3 --psm {psm}'
+        if whitelist:
+            config += f' -c tessedit_char_whitelist={whitelist}'
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+
+class TesserocrBackend(OcrBackend):
+    """tesserocr后端：引擎在进程内初始化一次后常驻，按线程和语言缓存"""
+    name = 'tesserocr'
+
+    def __init__(self, tessdata_dir=TESSDATA_DIR):
+        if tesserocr is None:
+            raise RuntimeError("未安装tesserocr")
+        self.tessdata_dir = tessdata_dir if tessdata_dir and os.path.isdir(tessdata_dir) else None
+        self._local = threading.local()
+        self._apis = []
+        self._lock = threading.Lock()
+
+    def _get_api(self, lang, psm):
+        apis = getattr(self._local, 'apis', None)
+        if apis is None:
+            apis = self._local.apis = {}
+        if (lang, psm) not in apis:
+            kwargs = {'lang': lang, 'psm': psm}
+            if self.tessdata_dir:
+                kwargs['path'] = self.tessdata_dir
+            api = tesserocr.PyTessBaseAPI(**kwargs)
+            apis[(lang, psm)] = api
+            with self._lock:
+                self._apis.append(api)
+        return apis[(lang, psm)]
+
+    def recognize(self, image, lang='eng', psm=7, whitelist=''):
+        api = self._get_api(lang, psm)
+        api.SetVariable('tessedit_char_whitelist', whitelist)
+        api.SetImage(image)
+        return api.GetUTF8Text()
+
+    def close(self):
+        with self._lock:
+            for api in self._apis:
+                api.End()
+            self._apis.clear()
+        self._local = threading.local()
+
+
+OCR_BACKENDS = {
+    'pytesseract': PytesseractBackend,
+    'tesserocr': TesserocrBackend,
+}
+
+
+def available_backends():
+    """当前环境可用的OCR后端名称"""
+    names = ['pytesseract']
+    if tesserocr is not None:
+        names.insert(0, 'tesserocr')
+    return names
+
+
+def create_ocr_backend(name='auto'):
+    """创建OCR后端，auto优先使用常驻引擎，未安装时回退到pytesseract"""
+    if name == 'auto':
+        name = available_backends()[0]
+    return OCR_BACKENDS[name]()
+
+
+def user_data_dir():
+    """用户数据目录：Windows下为%LOCALAPPDATA%\\tuxsb，其他系统为~/.local/share/tuxsb"""
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.local', 'share')
+    return os.path.join(base, 'tuxsb')
+
+
+OCR_MAX_WORKERS = 8  # 多区域并发识别的最大线程数
+GLYPH_DIR = os.path.join(user_data_dir(), 'glyphs')  # 学习到的字形模板不放在源码目录中
+GLYPH_SIZE = 24  # 字形归一化后的边长
+GLYPH_VARIANTS = 4  # 每个字符最多保存的模板数
+
+
+def binarize(image):
+    """灰度 + Otsu二值化，统一为黑底白字"""
+    gray = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2GRAY)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if np.count_nonzero(binary) > binary.size / 2:
+        binary = 255 - binary
+    return binary
+
+
+class GlyphDigitRecognizer:
+    """固定字体的数字识别：连通域切分字形，与学习到的字形模板做相关匹配"""
+
+    def __init__(self, font='default', min_confidence=0.8, glyph_dir=GLYPH_DIR):
+        self.font = font
+        self.min_confidence = min_confidence
+        self.path = os.path.join(glyph_dir, f'{font}.npz')
+        self.chars = []  # 每个模板对应的字符
+        self.templates = np.zeros((0, GLYPH_SIZE * GLYPH_SIZE), np.float32)
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.path):
+            data = np.load(self.path)
+            self.chars = list(str(data['chars']))
+            self.templates = data['templates']
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        np.savez(self.path, chars=''.join(self.chars), templates=self.templates)
+
+    def reset(self):
+        """清空学习到的模板，学错字形时使用"""
+        self.chars = []
+        self.templates = np.zeros((0, GLYPH_SIZE * GLYPH_SIZE), np.float32)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @staticmethod
+    def segment(binary):
+        """按连通域切分字形，x方向重叠的连通域(如冒号的两点)合并，按从左到右返回"""
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        if count <= 1:
+            return []
+
+        # 去掉相对最大连通域过小的噪点
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        min_area = max(4, areas.max() * 0.02)
+        boxes = sorted(
+            [list(stats[i, :4]) for i in range(1, count) if stats[i, cv2.CC_STAT_AREA] >= min_area],
+            key=lambda box: box[0]
+        )
+
+        merged = []
+        for x, y, w, h in boxes:
+            if merged and x < merged[-1][0] + merged[-1][2]:
+                mx, my, mw, mh = merged[-1]
+                right, bottom = max(mx + mw, x + w), max(my + mh, y + h)
+                mx, my = min(mx, x), min(my, y)
+                merged[-1] = [mx, my, right - mx, bottom - my]
+            else:
+                merged.append([x, y, w, h])
+
+        return [binary[y:y + h, x:x + w] for x, y, w, h in merged]
+
+    @staticmethod
+    def normalize(glyph):
+        """等比缩放后居中放入固定大小画布，转为零均值单位长度向量"""
+        h, w = glyph.shape
+        scale = GLYPH_SIZE / max(h, w)
+        resized = cv2.resize(glyph, (max(1, round(w * scale)), max(1, round(h * scale))),
+                             interpolation=cv2.INTER_AREA)
+        canvas = np.zeros((GLYPH_SIZE, GLYPH_SIZE), np.float32)
+        top = (GLYPH_SIZE - resized.shape[0]) // 2
+        left = (GLYPH_SIZE - resized.shape[1]) // 2
+        canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+        vector = canvas.ravel() - canvas.mean()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def recognize(self, binary):
+        """识别二值图中的字符，返回(文本, 置信度)，置信度为所有字形中最低的相关系数"""
+        glyphs = self.segment(binary)
+        if not glyphs or not self.chars:
+            return '', 0.0
+
+        vectors = np.stack([self.normalize(glyph) for glyph in glyphs])
+        scores = vectors @ self.templates.T
+        best = scores.argmax(axis=1)
+        text = ''.join(self.chars[i] for i in best)
+        return text, float(scores[np.arange(len(best)), best].min())
+
+    def learn(self, binary, text):
+        """用已知文本学习字形模板，字形数量与字符数不一致时放弃"""
+        glyphs = self.segment(binary)
+        chars = [c for c in text if not c.isspace()]
+        if not glyphs or len(glyphs) != len(chars):
+            return False
+
+        changed = False
+        for char, glyph in zip(chars, glyphs):
+            vector = self.normalize(glyph)
+            same = [i for i, c in enumerate(self.chars) if c == char]
+            if len(same) >= GLYPH_VARIANTS:
+                continue
+            if same and (self.templates[same] @ vector).max() > 0.95:
+                continue
+            self.chars.append(char)
+            self.templates = np.vstack([self.templates, vector[np.newaxis].astype(np.float32)])
+            changed = True
+
+        if changed:
+            self.save()
+        return True
+
+
+def stage_gray(image):
+    """转换为灰度图"""
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+
+
+def make_upscale(factor, interpolation):
+    """放大图像以提高识别率"""
+    def stage_upscale(image):
+        return cv2.resize(image, None, fx=factor, fy=factor, interpolation=interpolation)
+    return stage_upscale
+
+
+def stage_clahe(image):
+    """增强对比度"""
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    return clahe.apply(image)
+
+
+def stage_otsu(image):
+    """Otsu二值化"""
+    _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary
+
+
+def stage_median(image):
+    """中值滤波去除孤立噪点"""
+    return cv2.medianBlur(image, 3)
+
+
+def stage_denoise(image):
+    """非局部均值降噪，效果好但较慢"""
+    return cv2.fastNlMeansDenoising(image)
+
+
+def stage_dilate(image):
+    """轻微膨胀，使数字更清晰"""
+    return cv2.dilate(image, np.ones((2, 2), np.uint8), iterations=1)
+
+
+# 预处理预设，从快到稳
+PREPROCESS_PRESETS = {
+    'fast': [
+        ('gray', stage_gray),
+        ('upscale', make_upscale(2, cv2.INTER_LINEAR)),
+        ('otsu', stage_otsu),
+    ],
+    'balanced': [
+        ('gray', stage_gray),
+        ('upscale', make_upscale(3, cv2.INTER_CUBIC)),
+        ('clahe', stage_clahe),
+        ('otsu', stage_otsu),
+        ('median', stage_median),
+        ('dilate', stage_dilate),
+    ],
+    'robust': [
+        ('upscale', make_upscale(3, cv2.INTER_LANCZOS4)),
+        ('gray', stage_gray),
+        ('clahe', stage_clahe),
+        ('otsu', stage_otsu),
+        ('denoise', stage_denoise),
+        ('dilate', stage_dilate),
+    ],
+}
+
+
+class DebugImageSink:
+    """调试图像输出：保存原图和每个预处理步骤的结果"""
+
+    def __init__(self, directory, prefix='time'):
+        self.directory = directory
+        self.prefix = prefix
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, stage, image):
+        cv2.imwrite(os.path.join(self.directory, f'{self.prefix}_{stage}.png'),
+                    cv2.cvtColor(image, cv2.COLOR_RGB2BGR) if image.ndim == 3 else image)
+
+
+class PreprocessPipeline:
+    """由多个步骤组成的预处理流程"""
+
+    def __init__(self, stages):
+        self.stages = stages
+
+    @classmethod
+    def from_preset(cls, name):
+        return cls(PREPROCESS_PRESETS[name])
+
+    def run(self, image, debug_sink=None):
+        """依次执行各步骤，返回PIL图像"""
+        array = np.array(image)
+        if debug_sink:
+            debug_sink('original', array)
+        for name, stage in self.stages:
+            array = stage(array)
+            if debug_sink:
+                debug_sink(name, array)
+        return Image.fromarray(array)
+
+
+class RegionChangeDetector:
+    """截图变化检测：像素完全相同时用哈希直接判断，否则按原分辨率统计灰度明显变化的像素数
+
+    不缩小画面，区域比文字大很多时一个数字的变化也不会被平均掉
+    """
+
+    def __init__(self, threshold=48, min_pixels=3):
+        self.threshold = threshold  # 灰度差超过该值的像素视为变化
+        self.min_pixels = min_pixels  # 变化像素达到该数量才认为画面有变化，过滤个别像素的抖动
+        self.last_digest = None
+        self.last_gray = None
+
+    def changed(self, image):
+        """与上次记录的画面相比是否有变化，有变化时更新记录"""
+        array = np.asarray(image)
+        digest = hashlib.blake2b(array.tobytes(), digest_size=16).digest()
+        if digest == self.last_digest:
+            return False
+
+        gray = cv2.cvtColor(array, cv2.COLOR_RGB2GRAY) if array.ndim == 3 else array
+        if self.last_gray is not None and self.last_gray.shape == gray.shape and \
+                np.count_nonzero(cv2.absdiff(gray, self.last_gray) > self.threshold) < self.min_pixels:
+            self.last_digest = digest
+            return False
+
+        self.last_digest = digest
+        self.last_gray = gray.copy()
+        return True
+
+
+# Tesseract识别方式: (名称, 是否反色, 语言)
+OCR_PASSES = [
+    ('normal', False, 'eng'),
+    ('inverted', True, 'chi_sim'),
+]
+
+
+class PassSelector:
+    """记录各识别方式最近的成功情况，优先使用成功率高的方式"""
+
+    def __init__(self, window=20):
+        self.history = {name: deque(maxlen=window) for name, _, _ in OCR_PASSES}
+        self.stats = {'reads': 0, 'first_pass': 0, 'fallback': 0, 'failed': 0}
+
+    def success_rate(self, name):
+        history = self.history[name]
+        # 没有记录的方式按0.5计算
+        return sum(history) / len(history) if history else 0.5
+
+    def order(self):
+        """按最近成功率从高到低排列识别方式，成功率相同保持默认顺序"""
+        return sorted(OCR_PASSES, key=lambda p: -self.success_rate(p[0]))
+
+    def record(self, name, success):
+        self.history[name].append(1 if success else 0)
+
+    def record_read(self, attempt):
+        """记录一次识别：attempt为成功时的尝试序号，None表示全部失败"""
+        self.stats['reads'] += 1
+        if attempt is None:
+            self.stats['failed'] += 1
+        elif attempt == 0:
+            self.stats['first_pass'] += 1
+        else:
+            self.stats['fallback'] += 1
+
+    def rates(self):
+        """首次成功率和回退率"""
+        reads = self.stats['reads'] or 1
+        return {
+            'first_pass': self.stats['first_pass'] / reads,
+            'fallback': (self.stats['fallback'] + self.stats['failed']) / reads,
+        }
 
 
 class ScreenTimeReader:
-    def __init__(self):
-        # 设置Tesseract路径
-        pytesseract.pytesseract.tesseract_cmd = r'D:\Program Files\Tesseract-OCR\tesseract.exe'
+    def __init__(self, backend=None, font='default', preset='robust', debug_dir=None):
+        # OCR后端，默认优先使用常驻引擎
+        self.ocr = backend or create_ocr_backend()
+
+        # 预处理流程，指定调试目录时保存每一步的图像
+        self.pipeline = PreprocessPipeline.from_preset(preset)
+        self.debug_sink = DebugImageSink(debug_dir) if debug_dir else None
+
+        # 固定字体数字识别，置信度不足时再使用Tesseract
+        self.glyphs = GlyphDigitRecognizer(font)
 
         # 优化时间识别的配置
-        self.custom_config = r'--oem 3 --psm 7 -c tessedit_char_whitelist=0123456789:'
+        self.psm = 7
+        self.whitelist = '0123456789:'
 
-    def capture_screen_region(self, x, y, width, height):
-        """截取指定区域的屏幕"""
+        # 每个区域的变化检测器和上次识别结果
+        self.regions = {}
+        self.stats = {'reads': 0, 'cached': 0, 'ocr_calls': 0}
+
+        # 每个区域的识别方式选择
+        self.selectors = {}
+
+    def grab_region(self, x, y, width, height):
+        """截取指定区域的原始屏幕图像"""
         try:
-            screenshot = pyautogui.screenshot(region=(x, y, width, height))
-            # 放大图像以提高识别率
-            screenshot = screenshot.resize((width * 3, height * 3), Image.Resampling.LANCZOS)
-            return screenshot
+            return pyautogui.screenshot(region=(x, y, width, height))
         except Exception as e:
             print(f"截图失败: {e}")
             return None
 
-    def preprocess_image(self, image):
-        """针对时间格式优化的图像预处理"""
-        # 转换为OpenCV格式
-        opencv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-
-        # 转换为灰度图
-        gray = cv2.cvtColor(opencv_image, cv2.COLOR_BGR2GRAY)
-
-        # 增强对比度
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(gray)
-
-        # 二值化处理
-        _, binary = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-
-        # 降噪
-        denoised = cv2.fastNlMeansDenoising(binary)
-
-        # 轻微膨胀，使数字更清晰
-        kernel = np.ones((2, 2), np.uint8)
-        dilated = cv2.dilate(denoised, kernel, iterations=1)
-
-        # 保存处理后的图像用于调试
-        cv2.imwrite('processed_time.png', dilated)
+    def capture_screen_region(self, x, y, width, height):
+        """截取指定区域的屏幕，放大由预处理流程完成"""
+        return self.grab_region(x, y, width, height)
 
-        return Image.fromarray(dilated)
+    def preprocess_image(self, image):
+        """按当前预设对截图做预处理"""
+        return self.pipeline.run(image, self.debug_sink)
 
     def is_valid_time(self, time_str):
         """验证时间格式是否有效"""
@@ -73,57 +472,332 @@ class ScreenTimeReader:
         return False
 
     def read_time_from_region(self, x, y, width, height):
-        """从指定区域读取时间"""
-        screenshot = self.capture_screen_region(x, y, width, height)
-        if screenshot is None:
+        """从指定区域读取时间，画面没有变化时直接返回上次的结果"""
+        raw = self.grab_region(x, y, width, height)
+        if raw is None:
             return None
 
+        self.stats['reads'] += 1
+        region = (x, y, width, height)
+        if region not in self.regions:
+            self.regions[region] = [RegionChangeDetector(), None]
+        state = self.regions[region]
+        if not state[0].changed(raw):
+            self.stats['cached'] += 1
+            return state[1]
+
+        state[1] = self.recognize_time(raw, region)
+        return state[1]
+
+    def watch_time(self, x, y, width, height, interval=1.0):
+        """持续监控区域，识别结果变化时才产出新值"""
+        last = None
+        next_tick = time.monotonic()
+        while True:
+            text = self.read_time_from_region(x, y, width, height)
+            if text and text != last:
+                last = text
+                yield text
+            next_tick += interval
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+
+    def learn_glyphs(self, screenshot, text):
+        """用确认无误的读数学习字形模板"""
+        return self.glyphs.learn(binarize(screenshot), text)
+
+    def recognize_time(self, screenshot, region=None, pipeline=None, accept=None, max_passes=None):
+        """识别截图中的时间
+
+        region用于区分不同区域的识别方式统计；pipeline指定预处理流程，默认使用当前预设；
+        accept判断结果是否可接受，默认为有效时间；max_passes限制Tesseract识别次数。
+        格式有效的结果也可能是误读，这里不学习字形模板，由ClockTracker确认读数后调用learn_glyphs。
+        """
+        accept = accept or self.is_valid_time
         try:
-            # 保存原始截图
-            screenshot.save('original_time.png')
+            # 先用字形模板快速识别
+            binary = binarize(screenshot)
+            text, confidence = self.glyphs.recognize(binary)
+            if confidence >= self.glyphs.min_confidence and self.is_valid_time(text) and accept(text):
+                return text
 
             # 预处理图像
-            processed_image = self.preprocess_image(screenshot)
+            processed_image = (pipeline or self.pipeline).run(screenshot, self.debug_sink)
 
-            # 尝试不同的处理方式
+            # 按该区域最近的成功情况排序识别方式，只有结果不可接受时才尝试下一种
+            selector = self.selectors.setdefault(region, PassSelector())
             results = []
+            for attempt, (name, inverted, lang) in enumerate(selector.order()[:max_passes]):
+                image = Image.fromarray(255 - np.array(processed_image)) if inverted else processed_image
+                self.stats['ocr_calls'] += 1
+                text = ' '.join(self.ocr.recognize(
+                    image,
+                    lang=lang,
+                    psm=self.psm,
+                    whitelist=self.whitelist
+                ).split())
+
+                valid = self.is_valid_time(text)
+                selector.record(name, valid)
+                if valid and accept(text):
+                    selector.record_read(attempt)
+                    return text
+                if text:
+                    results.append(text)
+
+            selector.record_read(None)
+            # 都不是有效时间时返回最长的结果
+            return max(results, key=len, default=None)
 
-            # 直接识别
-            text1 = pytesseract.image_to_string(
-                processed_image,
-                config=self.custom_config
-            ).strip()
-            if text1:
-                results.append(text1)
-
-            # 反色识别
-            inverted_image = Image.fromarray(255 - np.array(processed_image))
-            text2 = pytesseract.image_to_string(
-                inverted_image,
-                lang='chi_sim',
-                config=self.custom_config
-            ).strip()
-            if text2:
-                results.append(text2)
-
-            # 合并结果
-            if results:
-                # 清理结果，去除空白字符
-                cleaned_results = [' '.join(result.split()) for result in results]
-                # 选择最长的有效结果
-                final_result = max(cleaned_results, key=len, default='')
-                if final_result:
-                    return final_result
+        except Exception as e:
+            print(f"OCR识别失败: {e}")
+            return None
 
+
+def time_to_seconds(time_str):
+    """HH:MM 或 HH:MM:SS 转为 (当天秒数, 精度秒数)"""
+    parts = list(map(int, time_str.split(':')))
+    if len(parts) == 3:
+        return parts[0] * 3600 + parts[1] * 60 + parts[2], 1
+    return parts[0] * 3600 + parts[1] * 60, 60
+
+
+class ClockTracker:
+    """时钟读数跟踪：按经过的时间预测当前值，符合预测的读数只需一次快速识别，
+    不符时才用更重的预处理复核；跳变后的读数连续多次符合从跳变值推算的预测，才认为时钟被调整"""
+
+    DAY_SECONDS = 24 * 3600
+
+    def __init__(self, reader: ScreenTimeReader, x, y, width, height,
+                 fast_preset='fast', escalate_preset='robust', confirm=2, max_gap=600):
+        self.reader = reader
+        self.region = (x, y, width, height)
+        self.fast_pipeline = PreprocessPipeline.from_preset(fast_preset)
+        self.escalate_pipeline = PreprocessPipeline.from_preset(escalate_preset)
+        self.confirm = confirm  # 跳变需要连续一致的次数
+        self.max_gap = max_gap  # 超过该秒数没有读数时不再预测
+        self.detector = RegionChangeDetector()
+
+        self.value = None
+        self.value_seconds = 0
+        self.resolution = 60
+        self.value_time = 0.0
+        self.pending = None  # 疑似跳变后的读数
+        self.pending_time = 0.0
+        self.pending_count = 0
+        self.stats = {'reads': 0, 'unchanged': 0, 'fast': 0, 'escalated': 0, 'rejected': 0, 'resynced': 0}
+
+    def predict(self, now, value=None, value_time=None):
+        """从value(默认为当前读数)推算现在可能的读数(当天秒数集合)，无法预测时返回None"""
+        if value is None:
+            value, value_time = self.value, self.value_time
+        elapsed = now - value_time
+        if value is None or elapsed > self.max_gap:
             return None
+        seconds, resolution = time_to_seconds(value)
+        steps = int((elapsed + 1) // resolution) + 1
+        return {(seconds + k * resolution) % self.DAY_SECONDS for k in range(steps + 1)}
+
+    def update(self, text, now, confirmed_frame=None):
+        """接受新的读数；confirmed_frame为读数已被确认的截图时用它学习字形模板"""
+        if confirmed_frame is not None:
+            self.reader.learn_glyphs(confirmed_frame, text)
+        self.value = text
+        self.value_seconds, self.resolution = time_to_seconds(text)
+        self.value_time = now
+        self.pending = None
+        self.pending_count = 0
+        return text
+
+    def read(self):
+        """读取一次时钟，返回跟踪后的读数"""
+        raw = self.reader.grab_region(*self.region)
+        if raw is None:
+            return self.value
+
+        self.stats['reads'] += 1
+        now = time.monotonic()
+        # 有待确认的跳变时每次都要识别，否则时钟只显示到分钟时无法确认
+        if not self.detector.changed(raw) and self.value is not None and self.pending is None:
+            self.stats['unchanged'] += 1
+            return self.value
+
+        predicted = self.predict(now)
+
+        def accept(text):
+            if not self.reader.is_valid_time(text):
+                return False
+            return predicted is None or time_to_seconds(text)[0] in predicted
+
+        # 先用快速预处理只识别一次
+        # 没有预测时读数未经确认，不学习字形模板
+        confirmed_frame = raw if predicted is not None else None
+        text = self.reader.recognize_time(raw, self.region, self.fast_pipeline, accept, max_passes=1)
+        if text and accept(text):
+            self.stats['fast'] += 1
+            return self.update(text, now, confirmed_frame)
+
+        # 与预测不符时用更重的预处理复核
+        self.stats['escalated'] += 1
+        text = self.reader.recognize_time(raw, self.region, self.escalate_pipeline, accept)
+        if text and accept(text):
+            return self.update(text, now, confirmed_frame)
+
+        # 仍然不符：之后的读数连续符合从跳变值推算的预测，才认为时钟被调整
+        if text and self.reader.is_valid_time(text):
+            pending_predicted = self.predict(now, self.pending, self.pending_time) if self.pending else None
+            if pending_predicted is not None and time_to_seconds(text)[0] in pending_predicted:
+                self.pending_count += 1
+            else:
+                self.pending_count = 1
+            self.pending, self.pending_time = text, now
+            if self.pending_count >= self.confirm:
+                self.stats['resynced'] += 1
+                return self.update(text, now, raw)
+
+        self.stats['rejected'] += 1
+        return self.value
+
+    def watch(self, interval=1.0):
+        """持续跟踪，读数变化时才产出新值"""
+        last = None
+        next_tick = time.monotonic()
+        while True:
+            text = self.read()
+            if text and text != last:
+                last = text
+                yield text
+            next_tick += interval
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+
+
+@dataclass
+class OcrRegion:
+    """需要识别的屏幕区域及其识别设置"""
+    name: str
+    x: int
+    y: int
+    width: int
+    height: int
+    lang: str = 'eng'
+    whitelist: str = ''
+    preset: str = 'balanced'
+    psm: int = 7
+
+
+@dataclass
+class TickResult:
+    """一次截图中所有区域的识别结果"""
+    timestamp: float
+    values: Dict[str, Optional[str]] = field(default_factory=dict)
+    latency: float = 0.0  # 截图到全部识别完成的耗时(秒)
+
+
+class RegionRegistry:
+    """区域登记表"""
+
+    def __init__(self):
+        self.regions: Dict[str, OcrRegion] = {}
+
+    def add(self, region: OcrRegion):
+        self.regions[region.name] = region
+        return region
+
+    def remove(self, name):
+        self.regions.pop(name, None)
+
+    def __iter__(self):
+        return iter(list(self.regions.values()))
+
+    def __len__(self):
+        return len(self.regions)
+
+    def bounding_box(self):
+        """包含所有区域的最小矩形 (x, y, width, height)"""
+        left = min(r.x for r in self.regions.values())
+        top = min(r.y for r in self.regions.values())
+        right = max(r.x + r.width for r in self.regions.values())
+        bottom = max(r.y + r.height for r in self.regions.values())
+        return left, top, right - left, bottom - top
+
+
+class MultiRegionReader:
+    """每次只截一次屏，切分出所有区域后在线程池中并发识别
+
+    线程池按最大线程数创建，线程在需要时才启动，之后登记的区域同样可以并发识别
+    """
+
+    def __init__(self, registry: RegionRegistry, backend=None, max_workers=OCR_MAX_WORKERS):
+        self.registry = registry
+        self.ocr = backend or create_ocr_backend()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.pipelines = {}
+        self.detectors = {}
+        self.cache = {}
 
+    def get_pipeline(self, preset):
+        if preset not in self.pipelines:
+            self.pipelines[preset] = PreprocessPipeline.from_preset(preset)
+        return self.pipelines[preset]
+
+    def recognize_region(self, region: OcrRegion, image):
+        """识别单个区域，画面没有变化时返回上次的结果"""
+        detector = self.detectors.setdefault(region.name, RegionChangeDetector())
+        if not detector.changed(image):
+            return self.cache.get(region.name)
+
+        try:
+            processed = self.get_pipeline(region.preset).run(image)
+            text = self.ocr.recognize(processed, lang=region.lang, psm=region.psm,
+                                      whitelist=region.whitelist)
+            text = ' '.join(text.split()) or None
         except Exception as e:
-            print(f"OCR识别失败: {e}")
-            return None
+            print(f"区域 {region.name} 识别失败: {e}")
+            text = None
+        self.cache[region.name] = text
+        return text
+
+    def read_all(self):
+        """截一次屏并识别所有区域"""
+        regions = list(self.registry)
+        if not regions:
+            return TickResult(time.time())
+
+        left, top, width, height = self.registry.bounding_box()
+        timestamp = time.time()
+        start = time.perf_counter()
+        capture = np.array(pyautogui.screenshot(region=(left, top, width, height)))
+
+        futures = {}
+        for region in regions:
+            crop = capture[region.y - top:region.y - top + region.height,
+                           region.x - left:region.x - left + region.width]
+            futures[region.name] = self.pool.submit(self.recognize_region, region, crop)
+
+        values = {name: future.result() for name, future in futures.items()}
+        return TickResult(timestamp, values, time.perf_counter() - start)
+
+    def watch(self, interval=1.0):
+        """按固定间隔持续识别，每次产出一条结果"""
+        next_tick = time.monotonic()
+        while True:
+            yield self.read_all()
+            next_tick += interval
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.ocr.close()
 
 
 def main():
+    parser = argparse.ArgumentParser(description='识别屏幕区域中的时钟')
+    parser.add_argument('--reset-glyphs', action='store_true', help='清空学习到的字形模板后再开始')
+    args = parser.parse_args()
+
     reader = ScreenTimeReader()
+    if args.reset_glyphs:
+        reader.glyphs.reset()
+        print(f"已清空字形模板: {reader.glyphs.path}")
 
     print("请准备在3秒内将鼠标移动到目标区域左上角...")
     time.sleep(3)
@@ -140,17 +814,27 @@ def main():
 
     print(f"\n开始监控区域: ({x1}, {y1}, {width}, {height})")
 
+    tracker = ClockTracker(reader, x1, y1, width, height)
+    start = time.monotonic()
+
     try:
-        while True:
-            text = reader.read_time_from_region(x1, y1, width, height)
-            if text:
-                print(f"识别到的时间: {text}")
-            else:
-                print("未识别到时间")
-            time.sleep(1)
+        # 只在识别结果变化时输出
+        for text in tracker.watch(interval=1):
+            print(f"识别到的时间: {text}")
 
     except KeyboardInterrupt:
         print("\n程序已停止")
+        minutes = max((time.monotonic() - start) / 60, 1 / 60)
+        stats = tracker.stats
+        print(f"共读取 {stats['reads']} 次，画面未变化 {stats['unchanged']} 次，快速识别 {stats['fast']} 次，"
+              f"复核 {stats['escalated']} 次，拒绝 {stats['rejected']} 次，重新同步 {stats['resynced']} 次")
+        print(f"OCR调用 {reader.stats['ocr_calls']} 次，平均每分钟 {reader.stats['ocr_calls'] / minutes:.1f} 次")
+        for selector in reader.selectors.values():
+            rates = selector.rates()
+            print(f"Tesseract识别 {selector.stats['reads']} 次，一次成功率 {rates['first_pass']:.0%}，"
+                  f"回退率 {rates['fallback']:.0%}")
+    finally:
+        reader.ocr.close()
 
 
 if __name__ == "__main__":
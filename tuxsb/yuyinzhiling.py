@@ -2,14 +2,481 @@ import speech_recognition as sr
 import webbrowser
 import os
 import time
+import threading
+import queue
+import json
+import hashlib
+import difflib
+from collections import deque, defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, List
 
+import numpy as np
+
+try:
+    import webrtcvad  # 可选：更准确的语音活动检测
+except ImportError:
+    webrtcvad = None
+
+try:
+    import vosk  # 可选：离线语音识别
+except ImportError:
+    vosk = None
+
+# vosk中文模型目录，可从 https://alphacephei.com/vosk/models 下载
+VOSK_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vosk-model-small-cn')
+# 命令数量不超过该值时优先使用关键词识别
+KEYWORD_MAX_COMMANDS = 50
+
+# 打开浏览器的命令关键词
+OPEN_COMMANDS = ['打开谷歌', '打开浏览器', '打开chrome', '启动浏览器']
+
+# 连续监听的音频参数：16kHz 单声道，每帧30毫秒
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+
+class VoiceActivityDetector:
+    """语音活动检测：优先使用webrtcvad，未安装时使用随环境噪音自动调整的能量阈值"""
+
+    def __init__(self, aggressiveness=2, ratio=3.0, min_energy=100.0):
+        self.vad = webrtcvad.Vad(aggressiveness) if webrtcvad is not None else None
+        self.ratio = ratio  # 能量超过噪音水平的倍数视为语音
+        self.min_energy = min_energy
+        self.noise_level = min_energy / ratio
+
+    @staticmethod
+    def energy(frame):
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+        return float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+
+    def calibrate(self, frames):
+        """用一段环境音初始化噪音水平"""
+        if frames:
+            self.noise_level = float(np.mean([self.energy(frame) for frame in frames]))
+
+    def is_speech(self, frame):
+        energy = self.energy(frame)
+        threshold = max(self.min_energy, self.noise_level * self.ratio)
+        if self.vad is not None:
+            speech = self.vad.is_speech(frame, SAMPLE_RATE)
+        else:
+            speech = energy > threshold
+        if not speech:
+            # 非语音帧持续更新噪音水平，不需要停下来重新校准
+            self.noise_level = 0.95 * self.noise_level + 0.05 * energy
+        return speech
+
+
+class UtteranceSegmenter:
+    """把连续的音频帧切分为一句句话"""
+
+    def __init__(self, pre_roll_ms=300, start_ms=90, end_silence_ms=500, max_phrase_ms=5000):
+        self.pre_roll = deque(maxlen=pre_roll_ms // FRAME_MS)
+        self.start_frames = max(1, start_ms // FRAME_MS)  # 连续多少帧语音才算开始说话
+        self.end_frames = end_silence_ms // FRAME_MS  # 连续多少帧静音算一句结束
+        self.max_frames = max_phrase_ms // FRAME_MS
+        self.frames = []
+        self.speech_run = 0
+        self.silence_run = 0
+        self.in_phrase = False
+
+    def feed(self, frame, speech):
+        """输入一帧，一句话结束时返回整句音频，否则返回None"""
+        if not self.in_phrase:
+            self.pre_roll.append(frame)
+            self.speech_run = self.speech_run + 1 if speech else 0
+            if self.speech_run >= self.start_frames:
+                self.in_phrase = True
+                self.frames = list(self.pre_roll)
+                self.pre_roll.clear()
+                self.silence_run = 0
+            return None
+
+        self.frames.append(frame)
+        self.silence_run = 0 if speech else self.silence_run + 1
+        if self.silence_run >= self.end_frames or len(self.frames) >= self.max_frames:
+            phrase = b''.join(self.frames)
+            self.frames = []
+            self.in_phrase = False
+            self.speech_run = 0
+            return phrase
+        return None
+
+
+class RecognizerBackend:
+    """语音识别后端接口"""
+    name = 'base'
+
+    def recognize(self, audio):
+        """识别一段sr.AudioData，无法识别时返回None"""
+        raise NotImplementedError
+
+
+class GoogleBackend(RecognizerBackend):
+    """Google在线识别，每次识别都需要网络请求"""
+    name = 'google'
+
+    def __init__(self, language='zh-CN'):
+        self.recognizer = sr.Recognizer()
+        self.language = language
+
+    def recognize(self, audio):
+        try:
+            return self.recognizer.recognize_google(audio, language=self.language)
+        except sr.UnknownValueError:
+            print("无法识别语音")
+        except sr.RequestError as e:
+            print(f"无法连接到语音识别服务；{e}")
+        return None
+
+
+class VoskBackend(RecognizerBackend):
+    """vosk本地离线识别，指定grammar时只在给定短语中识别
+
+    vosk会丢弃语法中不在模型词表里的词，所以短语先切分为词表中的词；
+    无法用词表表示的短语不放入语法并给出提示，其余短语仍按语法识别，全部无法表示时才改为自由识别
+    """
+    name = 'vosk'
+    MAX_WORD_CHARS = 4  # 切分中文短语时尝试的最长词
+
+    def __init__(self, model_path=VOSK_MODEL_DIR, grammar=None):
+        if vosk is None:
+            raise RuntimeError("未安装vosk")
+        self.model = vosk.Model(model_path)
+        self.grammar = None
+        self.unknown_phrases = []  # 无法用模型词表表示的短语
+        if grammar:
+            self.grammar = self.build_grammar(grammar)
+
+    def split_words(self, phrase):
+        """把短语切分为模型词表中的词：连续的英文和数字作为一个词，汉字按最长匹配切分，无法切分时返回None"""
+        phrase = normalize_command(phrase)
+        words = []
+        i = 0
+        while i < len(phrase):
+            if phrase[i].isascii() and phrase[i].isalnum():
+                end = i
+                while end < len(phrase) and phrase[end].isascii() and phrase[end].isalnum():
+                    end += 1
+                candidates = [phrase[i:end]]
+            else:
+                longest = min(self.MAX_WORD_CHARS, len(phrase) - i)
+                candidates = [phrase[i:i + n] for n in range(longest, 0, -1)]
+            for word in candidates:
+                if self.model.find_word(word) >= 0:
+                    words.append(word)
+                    i += len(word)
+                    break
+            else:
+                return None
+        return words
+
+    def build_grammar(self, phrases):
+        """生成vosk语法，跳过无法用词表表示的短语，没有可用的短语时返回None"""
+        entries = []
+        for phrase in phrases:
+            words = self.split_words(phrase)
+            if not words:
+                self.unknown_phrases.append(phrase)
+            else:
+                entries.append(' '.join(words))
+        if self.unknown_phrases:
+            print(f"以下命令短语不在vosk模型词表中，无法被识别: {self.unknown_phrases}")
+        if not entries:
+            print("没有可用于vosk语法的命令短语，改用自由识别")
+            return None
+        return json.dumps(entries + ['[unk]'], ensure_ascii=False)
+
+    def recognize(self, audio):
+        if self.grammar:
+            recognizer = vosk.KaldiRecognizer(self.model, SAMPLE_RATE, self.grammar)
+        else:
+            recognizer = vosk.KaldiRecognizer(self.model, SAMPLE_RATE)
+        recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2))
+        text = json.loads(recognizer.FinalResult()).get('text', '')
+        # 中文结果按字分隔，去掉空格；未匹配任何短语时返回[unk]
+        text = ''.join(text.replace('[unk]', '').split())
+        return text or None
+
+
+class KeywordSpotter(VoskBackend):
+    """关键词识别：解码只在固定的命令短语中搜索，命令集较小时速度最快"""
+    name = 'keyword'
+
+    def __init__(self, phrases, model_path=VOSK_MODEL_DIR):
+        super().__init__(model_path, grammar=phrases)
+        if self.grammar is None:
+            self.name = 'vosk'  # 没有可用的语法，实际是自由识别
+
+
+class WavFileBackend(RecognizerBackend):
+    """测试用的替身后端：按音频内容查找预先登记的WAV文件对应的文本"""
+    name = 'wav'
+
+    def __init__(self, transcripts=None):
+        self.transcripts = {}
+        self.clips = {}
+        for path, text in (transcripts or {}).items():
+            self.add(path, text)
+
+    @staticmethod
+    def digest(audio):
+        data = audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2)
+        return hashlib.sha1(data).hexdigest()
+
+    def add(self, path, text):
+        """登记WAV文件及其文本"""
+        with sr.AudioFile(path) as source:
+            audio = sr.Recognizer().record(source)
+        self.transcripts[self.digest(audio)] = text
+        self.clips[path] = (audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2), text)
+
+    def recognize(self, audio):
+        text = self.transcripts.get(self.digest(audio))
+        if text is not None:
+            return text
+        # 经过语音切分后的片段是原文件的一段，取中间一小段在登记的音频中查找
+        data = audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2)
+        middle = len(data) // 4 * 2
+        probe = data[middle:middle + SAMPLE_RATE // 10 * 2]  # 100ms
+        if not probe.strip(b'\x00'):
+            return None
+        for path, (clip, clip_text) in self.clips.items():
+            if clip.find(probe) >= 0:
+                return clip_text
+        return None
+
+
+def normalize_command(text):
+    """统一大小写并去掉空白，识别结果和命令短语都按这个规则比较"""
+    return ''.join(text.lower().split())
+
+
+class PhraseAutomaton:
+    """Aho-Corasick多模式匹配：一次扫描找出文本中出现的所有短语，耗时与短语数量无关"""
 
-class VoiceController:
     def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+    def add(self, phrase, value):
+        node = 0
+        for ch in phrase:
+            if ch not in self.goto[node]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[node][ch] = len(self.goto) - 1
+            node = self.goto[node][ch]
+        self.output[node].append((phrase, value))
+
+    def build(self):
+        """添加完所有短语后计算失配指针"""
+        pending = deque(self.goto[0].values())  # 第一层节点的失配指针都指向根
+        while pending:
+            node = pending.popleft()
+            for ch, child in self.goto[node].items():
+                pending.append(child)
+                fallback = self.fail[node]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(ch, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def search(self, text):
+        """返回文本中匹配到的 (短语, 值) 列表"""
+        node = 0
+        found = []
+        for ch in text:
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            found.extend(self.output[node])
+        return found
+
+
+@dataclass
+class CommandEvent:
+    """识别出的一条命令及各阶段的时间"""
+    text: str
+    captured_at: float  # 切分出整句的时间
+    recognized_at: float
+    recognize_time: float  # 识别本身的耗时，不含排队
+
+    @property
+    def latency(self):
+        """从切分出整句到识别完成的耗时"""
+        return self.recognized_at - self.captured_at
+
+
+@dataclass
+class Intent:
+    """一个命令意图：多种说法对应同一个动作"""
+    name: str
+    phrases: List[str]
+    action: Callable[[str], None]
+    description: str = ''
+
+
+@dataclass
+class CommandRegistry:
+    """命令注册表：先用自动机精确匹配短语，匹配不到时再做模糊匹配
+
+    模糊匹配只考虑和命令有共同关键词(相邻两字)的短语；短语开头的动词没有出现在命令中时
+    要求更高的相似度，避免"关闭浏览器"被当成"打开浏览器"执行相反的动作
+    """
+    fuzzy_cutoff: float = 0.6
+    strict_cutoff: float = 0.85  # 动词不一致时的相似度要求
+    intents: dict = field(default_factory=dict)
+    handlers: dict = field(default_factory=dict)
+
+    VERB_CHARS = 2  # 短语开头作为动词比较的字数
+
+    def __post_init__(self):
+        self.automaton = None
+        self.phrase_intents = {}
+        self.keyword_index = defaultdict(set)
+
+    @staticmethod
+    def keywords(text):
+        """文本中相邻两字组成的关键词，单字文本取其本身"""
+        return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+    def register(self, name, phrases, action, description=''):
+        self.intents[name] = Intent(name, list(phrases), action, description)
+        self.automaton = None  # 下次匹配时重新编译
+
+    def handler(self, key, factory):
+        """浏览器控制器等处理对象只创建一次，之后重复使用"""
+        if key not in self.handlers:
+            self.handlers[key] = factory()
+        return self.handlers[key]
+
+    def phrases(self):
+        return [phrase for intent in self.intents.values() for phrase in intent.phrases]
+
+    def compile(self):
+        self.automaton = PhraseAutomaton()
+        self.phrase_intents = {}
+        self.keyword_index = defaultdict(set)
+        for intent in self.intents.values():
+            for phrase in intent.phrases:
+                key = normalize_command(phrase)
+                self.automaton.add(key, intent)
+                self.phrase_intents[key] = intent
+                for keyword in self.keywords(key):
+                    self.keyword_index[keyword].add(key)
+        self.automaton.build()
+
+    def match(self, command):
+        """返回 (意图, 匹配到的短语)，没有匹配时返回 (None, None)"""
+        if self.automaton is None:
+            self.compile()
+        text = normalize_command(command)
+        if not text:
+            return None, None
+        found = self.automaton.search(text)
+        if found:
+            # 同时命中多个短语时取最长的一个
+            phrase, intent = max(found, key=lambda item: len(item[0]))
+            return intent, phrase
+
+        # 模糊匹配只比较和命令有共同关键词的短语
+        candidates = set()
+        for keyword in self.keywords(text):
+            candidates |= self.keyword_index.get(keyword, set())
+        scored = sorted(((difflib.SequenceMatcher(None, text, phrase).ratio(), phrase) for phrase in candidates),
+                        reverse=True)
+        for ratio, phrase in scored:
+            cutoff = self.fuzzy_cutoff if phrase[:self.VERB_CHARS] in text else self.strict_cutoff
+            if ratio >= cutoff:
+                return self.phrase_intents[phrase], phrase
+        return None, None
+
+    def dispatch(self, command):
+        """匹配并执行命令，返回执行的意图名称"""
+        intent, phrase = self.match(command)
+        if intent is None:
+            print(f"未知命令: {command}")
+            return None
+        intent.action(command)
+        return intent.name
+
+
+class BrowserController:
+    """浏览器控制：Chrome只注册一次"""
+
+    def __init__(self, chrome_path):
+        self.browser = None
+        # 检查 Chrome 是否已安装
+        if os.path.exists(chrome_path):
+            webbrowser.register('chrome', None, webbrowser.BackgroundBrowser(chrome_path))
+            self.browser = webbrowser.get('chrome')
+
+    def open(self, url):
+        try:
+            if self.browser is not None:
+                self.browser.open(url)
+                print("已打开 Google Chrome")
+            else:
+                print("未找到 Chrome 浏览器，尝试打开默认浏览器")
+                webbrowser.open(url)
+        except Exception as e:
+            print(f"打开浏览器时出错：{e}")
+
+
+def create_recognizer(name='auto', commands=OPEN_COMMANDS):
+    """创建识别后端；auto在安装了vosk且命令较少时使用关键词识别，否则离线识别，最后使用Google"""
+    if name == 'auto':
+        if vosk is not None and os.path.isdir(VOSK_MODEL_DIR):
+            name = 'keyword' if len(commands) <= KEYWORD_MAX_COMMANDS else 'vosk'
+        else:
+            name = 'google'
+    if name == 'keyword':
+        return KeywordSpotter(commands)
+    if name == 'vosk':
+        return VoskBackend()
+    if name == 'google':
+        return GoogleBackend()
+    raise ValueError(f"未知的识别后端: {name}")
+
+
+class VoiceController:
+    def __init__(self, backend=None):
         self.recognizer = sr.Recognizer()
         # 设置 Chrome 浏览器路径（Windows 默认安装路径）
         self.chrome_path = r'C:\Program Files\Google\Chrome\Application\chrome.exe'
 
+        self.registry = CommandRegistry()
+        self.register_commands()
+
+        # 识别后端及其识别耗时记录，backend可以是后端对象或create_recognizer的后端名称
+        if backend is None or isinstance(backend, str):
+            backend = create_recognizer(backend or 'auto', self.registry.phrases())
+        self.backend = backend
+        self.recognize_latencies = deque(maxlen=100)
+
+        # 连续监听
+        self.vad = VoiceActivityDetector()
+        self.phrases = queue.Queue()  # 切分好的语音片段: (音频, 切分出整句的时间)
+        self.commands = queue.Queue()  # 识别出的命令: CommandEvent
+        self.listening = False
+        self.segmenting = False  # 正在切分一句还没说完的话
+        self.ready = threading.Event()  # 环境噪音校准完成
+        self.threads = []
+
+    def browser(self):
+        return self.registry.handler('browser', lambda: BrowserController(self.chrome_path))
+
+    def register_commands(self):
+        """注册支持的命令"""
+        self.registry.register('open_browser', OPEN_COMMANDS,
+                               lambda command: self.browser().open('https://www.google.com'),
+                               '打开浏览器')
+
     def listen_for_command(self):
         """监听语音命令"""
         with sr.Microphone() as source:
@@ -21,60 +488,130 @@ class VoiceController:
                 audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=5)
                 print("正在处理语音...")
 
-                # 使用中文识别
-                command = self.recognizer.recognize_google(audio, language='zh-CN')
+                command = self.recognize(audio)
+                if command is None:
+                    return None
                 print(f"识别到的命令: {command}")
                 return command.lower()
 
             except sr.WaitTimeoutError:
                 print("没有检测到语音输入")
                 return None
-            except sr.UnknownValueError:
-                print("无法识别语音")
-                return None
-            except sr.RequestError as e:
-                print(f"无法连接到语音识别服务；{e}")
-                return None
 
-    def execute_command(self, command):
-        """执行语音命令"""
-        if command is None:
+    def recognize(self, audio):
+        """用当前后端识别并记录耗时"""
+        start = time.perf_counter()
+        text = self.backend.recognize(audio)
+        self.recognize_latencies.append(time.perf_counter() - start)
+        return text
+
+    def latency_report(self):
+        """当前后端的识别耗时统计(毫秒)"""
+        if not self.recognize_latencies:
+            return f"{self.backend.name}: 暂无识别记录"
+        values = np.array(self.recognize_latencies) * 1000
+        return (f"{self.backend.name}: 识别 {len(values)} 次，平均 {values.mean():.0f}ms，"
+                f"p50 {np.percentile(values, 50):.0f}ms，p90 {np.percentile(values, 90):.0f}ms")
+
+    def start_listening(self, calibrate_seconds=1.0, microphone=None):
+        """打开麦克风持续监听，只在开始时校准一次环境噪音；microphone可以换成虚拟麦克风"""
+        if self.listening:
             return
+        self.listening = True
+        self.ready.clear()
+        if microphone is None:
+            microphone = sr.Microphone(sample_rate=SAMPLE_RATE, chunk_size=FRAME_SAMPLES)
+        self.threads = [
+            threading.Thread(target=self._capture_loop, args=(microphone, calibrate_seconds), daemon=True),
+            threading.Thread(target=self._recognize_loop, daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def idle(self):
+        """没有正在切分的话，切分好的片段也都识别完了(结果已放入commands)"""
+        return not self.segmenting and self.phrases.unfinished_tasks == 0
+
+    def stop_listening(self):
+        self.listening = False
+        self.phrases.put(None)
+        for thread in self.threads:
+            thread.join(timeout=2)
+        self.threads = []
+
+    def _capture_loop(self, microphone, calibrate_seconds):
+        """采集线程：持续读取音频帧，按语音活动切分成句放入队列"""
+        segmenter = UtteranceSegmenter()
+        with microphone as source:
+            calibration = [source.stream.read(FRAME_SAMPLES)
+                           for _ in range(int(calibrate_seconds * 1000 / FRAME_MS))]
+            self.vad.calibrate(calibration)
+            self.ready.set()
+            print("正在听取命令...")
 
-        # 打开浏览器的命令关键词
-        open_commands = ['打开谷歌', '打开浏览器', '打开chrome', '启动浏览器']
+            while self.listening:
+                try:
+                    frame = source.stream.read(FRAME_SAMPLES)
+                    phrase = segmenter.feed(frame, self.vad.is_speech(frame))
+                    if phrase:
+                        audio = sr.AudioData(phrase, SAMPLE_RATE, source.SAMPLE_WIDTH)
+                        self.phrases.put((audio, time.perf_counter()))
+                except Exception as e:
+                    # 音频设备偶尔出错时跳过这一帧继续监听，不让采集线程悄悄退出
+                    print(f"读取音频时出错：{e}")
+                    time.sleep(FRAME_MS / 1000)
+                # 片段放入队列后再更新状态，idle()不会在两者之间误判为空闲
+                self.segmenting = segmenter.in_phrase
 
-        # 检查是否包含打开浏览器的命令
-        if any(cmd in command for cmd in open_commands):
+    def _recognize_loop(self):
+        """识别线程：依次识别队列中的语音片段，不阻塞采集"""
+        while self.listening:
+            item = self.phrases.get()
+            if item is None:
+                self.phrases.task_done()
+                break
+            audio, captured_at = item
+            start = time.perf_counter()
             try:
-                # 检查 Chrome 是否已安装
-                if os.path.exists(self.chrome_path):
-                    webbrowser.register('chrome', None,
-                                        webbrowser.BackgroundBrowser(self.chrome_path))
-                    webbrowser.get('chrome').open('https://www.google.com')
-                    print("已打开 Google Chrome")
-                else:
-                    print("未找到 Chrome 浏览器，尝试打开默认浏览器")
-                    webbrowser.open('https://www.google.com')
+                command = self.recognize(audio)
+                if command:
+                    now = time.perf_counter()
+                    self.commands.put(CommandEvent(command.lower(), captured_at, now, now - start))
             except Exception as e:
-                print(f"打开浏览器时出错：{e}")
+                # 后端抛出的异常(网络超时、vosk出错等)只影响这一句，继续识别后面的话
+                print(f"识别语音时出错：{e}")
+            finally:
+                self.phrases.task_done()
+
+    def execute_command(self, command):
+        """执行语音命令"""
+        if command is None:
+            return None
+        return self.registry.dispatch(command)
 
 
 def main():
     controller = VoiceController()
-    print("语音控制已启动")
-    print("支持的命令：'打开谷歌'、'打开浏览器'、'打开chrome'")
+    print(f"语音控制已启动，识别后端: {controller.backend.name}")
+    print("支持的命令：" + "、".join(f"'{phrase}'" for phrase in controller.registry.phrases()))
     print("按 Ctrl+C 退出程序")
 
+    controller.start_listening()
     try:
         while True:
-            command = controller.listen_for_command()
-            controller.execute_command(command)
-            time.sleep(0.5)  # 短暂暂停避免CPU过度使用
+            try:
+                event = controller.commands.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            print(f"识别到的命令: {event.text} (说完后 {event.latency * 1000:.0f}ms)")
+            controller.execute_command(event.text)
 
     except KeyboardInterrupt:
         print("\n程序已停止")
+        print(controller.latency_report())
+    finally:
+        controller.stop_listening()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()